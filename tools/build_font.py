@@ -1,7 +1,23 @@
 import csv
 import argparse
+import hashlib
+import os
+import pickle
+import sys
+from concurrent.futures import ProcessPoolExecutor
+import fontTools
 from fontTools.fontBuilder import FontBuilder
 from fontTools.pens.ttGlyphPen import TTGlyphPen
+from fontTools.ttLib import newTable
+from fontTools.ttLib.tables.BitmapGlyphMetrics import SmallGlyphMetrics
+from fontTools.ttLib.tables.E_B_D_T_ import ebdt_bitmap_format_1
+from fontTools.ttLib.tables.E_B_L_C_ import Strike, SbitLineMetrics, eblc_index_sub_table_1
+from fontTools.ttLib.tables._g_l_y_f import Glyph
+
+CELL_SIZE = 256
+DEFAULT_BITMAP_SCALES = (1, 2, 3, 4)
+FONT_SIZES = ("4x3", "5x4", "5x5")
+BUILD_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".build_cache")
 
 def parse_csv(csv_path):
     with open(csv_path, 'r', encoding='utf-8') as f:
@@ -64,40 +80,272 @@ def draw_glyph(pen, grid, max_rows, max_cols):
                 pen.lineTo((x_right, y_bottom))
                 pen.closePath()
 
-def build_font(mode):
-    import os
+def get_lit_cells(grid, max_rows, max_cols):
+    cells = []
+    for row_idx, row in enumerate(grid):
+        if row_idx >= max_rows:
+            break
+        for col_idx, cell in enumerate(row):
+            if col_idx >= max_cols:
+                break
+            if "#" in cell:
+                cells.append((row_idx, col_idx))
+    return cells
+
+def make_bitmap_glyph(cells, advance, max_rows, scale):
+    # Image format 1: small metrics, byte-aligned rows, cropped to the ink box
+    metrics = SmallGlyphMetrics()
+    metrics.Advance = advance
+    metrics.width = metrics.height = metrics.BearingX = metrics.BearingY = 0
+    rows = []
+    if cells:
+        top = min(r for r, c in cells)
+        left = min(c for r, c in cells)
+        metrics.height = (max(r for r, c in cells) - top + 1) * scale
+        metrics.width = (max(c for r, c in cells) - left + 1) * scale
+        metrics.BearingX = left * scale
+        # the outline puts the top of grid row 0 at max_rows cells above the baseline
+        metrics.BearingY = (max_rows - top) * scale
+        lit = set(cells)
+        row_bytes = (metrics.width + 7) // 8
+        for y in range(metrics.height):
+            bits = 0
+            for x in range(metrics.width):
+                if (top + y // scale, left + x // scale) in lit:
+                    bits |= 1 << (row_bytes * 8 - 1 - x)
+            rows.append(bits.to_bytes(row_bytes, "big"))
+
+    glyph = ebdt_bitmap_format_1(None, None)
+    glyph.metrics = metrics
+    glyph.imageData = b"".join(rows)
+    return glyph
+
+def make_line_metrics(bitmaps, ascender):
+    line = SbitLineMetrics()
+    line.ascender = ascender
+    line.descender = 0
+    line.widthMax = max(g.metrics.Advance for g in bitmaps)
+    line.caretSlopeNumerator = 1
+    line.caretSlopeDenominator = 0
+    line.caretOffset = 0
+    inked = [g.metrics for g in bitmaps if g.metrics.width] or [bitmaps[0].metrics]
+    line.minOriginSB = min(m.BearingX for m in inked)
+    line.minAdvanceSB = min(m.Advance - m.BearingX - m.width for m in inked)
+    line.maxBeforeBL = max(m.BearingY for m in inked)
+    line.minAfterBL = min(m.BearingY - m.height for m in inked)
+    line.pad1 = 0
+    line.pad2 = 0
+    return line
+
+def add_bitmap_strikes(font, glyph_order, glyph_grids, metrics, upm, max_rows, max_cols, scales, cached_bitmaps=None, used_bitmaps=None):
+    # One strike per scale: at ppem = scale * (upm / CELL_SIZE) every outline
+    # cell covers exactly scale x scale device pixels.
+    if cached_bitmaps is None:
+        cached_bitmaps = {}
+    if used_bitmaps is None:
+        used_bitmaps = {}
+    eblc = newTable("EBLC")
+    eblc.version = 2.0
+    eblc.strikes = []
+    ebdt = newTable("EBDT")
+    ebdt.version = 2.0
+    ebdt.strikeData = []
+
+    for scale in scales:
+        ppem = upm // CELL_SIZE * scale
+        bitmaps = {}
+        for name in glyph_order:
+            cells = tuple(get_lit_cells(glyph_grids.get(name, []), max_rows, max_cols))
+            advance = metrics[name][0] // CELL_SIZE * scale
+            key = (cells, advance, scale)
+            cached = cached_bitmaps.get(key)
+            if cached is None:
+                glyph = make_bitmap_glyph(cells, advance, max_rows, scale)
+                m = glyph.metrics
+                cached = (m.height, m.width, m.BearingX, m.BearingY, glyph.imageData)
+            else:
+                glyph = ebdt_bitmap_format_1(None, None)
+                glyph.metrics = SmallGlyphMetrics()
+                glyph.metrics.Advance = advance
+                glyph.metrics.height, glyph.metrics.width, glyph.metrics.BearingX, glyph.metrics.BearingY, glyph.imageData = cached
+            used_bitmaps[key] = cached
+            bitmaps[name] = glyph
+
+        index_sub_table = eblc_index_sub_table_1(None, None)
+        index_sub_table.indexFormat = 1
+        index_sub_table.imageFormat = 1
+        index_sub_table.names = list(glyph_order)
+        index_sub_table.locations = []
+
+        strike = Strike()
+        size_table = strike.bitmapSizeTable
+        size_table.colorRef = 0
+        size_table.hori = make_line_metrics(list(bitmaps.values()), ppem)
+        size_table.vert = make_line_metrics(list(bitmaps.values()), ppem)
+        size_table.ppemX = ppem
+        size_table.ppemY = ppem
+        size_table.bitDepth = 1
+        size_table.flags = 1 # horizontal metrics
+        strike.indexSubTables.append(index_sub_table)
+
+        eblc.strikes.append(strike)
+        ebdt.strikeData.append(bitmaps)
+
+    font["EBDT"] = ebdt
+    font["EBLC"] = eblc
+
+def verify_bitmaps(font_path, upm, scales):
+    # Rasterize every glyph twice with FreeType, once from the outline and once
+    # from the embedded strike, and check that both land on the same pixels.
+    try:
+        import freetype
+    except ImportError:
+        print("Error: bitmap verification requires freetype-py (pip install freetype-py)")
+        return False
+
+    def rasterize(face, glyph_index, flags):
+        face.load_glyph(glyph_index, flags | freetype.FT_LOAD_TARGET_MONO)
+        slot = face.glyph
+        from_strike = slot.format == freetype.FT_GLYPH_FORMAT_BITMAP
+        if not from_strike:
+            slot.render(freetype.FT_RENDER_MODE_MONO)
+        bitmap = slot.bitmap
+        pixels = set()
+        for y in range(bitmap.rows):
+            for x in range(bitmap.width):
+                byte = bitmap.buffer[y * bitmap.pitch + x // 8]
+                if byte & (0x80 >> (x % 8)):
+                    pixels.add((slot.bitmap_left + x, slot.bitmap_top - y))
+        return from_strike, pixels, slot.advance.x >> 6
+
+    face = freetype.Face(font_path)
+    mismatches = 0
+    for scale in scales:
+        ppem = upm // CELL_SIZE * scale
+        face.set_pixel_sizes(ppem, ppem)
+        for glyph_index in range(face.num_glyphs):
+            _, outline_pixels, outline_advance = rasterize(face, glyph_index, freetype.FT_LOAD_NO_BITMAP | freetype.FT_LOAD_NO_HINTING)
+            from_strike, bitmap_pixels, bitmap_advance = rasterize(face, glyph_index, freetype.FT_LOAD_DEFAULT)
+            if not from_strike or outline_pixels != bitmap_pixels or outline_advance != bitmap_advance:
+                mismatches += 1
+                print(f"Mismatch at {ppem} ppem: glyph {face.get_glyph_name(glyph_index).decode()}")
+
+    if mismatches:
+        print(f"Bitmap verification failed: {mismatches} glyph(s) differ from their outlines")
+        return False
+    print(f"Verified {face.num_glyphs} glyphs at {', '.join(str(upm // CELL_SIZE * s) for s in scales)} ppem")
+    return True
+
+def get_font_config(mode):
     base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
     if mode == "5x5":
-        csv_path = os.path.join(base_dir, 'docs', 'definitions', 'Times_Sitelew_Roman_5x5_pixels.csv')
-        max_rows = 5
-        max_cols = 5
-        upm = 1536
-        advance_width = 1536
-        char_width = 1280
-        font_name = "Times Sitelew Roman 5x5 pixels"
-        out_file = os.path.join(base_dir, 'ttf_fonts', 'Times_Sitelew_Roman_5x5_pixels.ttf')
+        return {
+            "csv_path": os.path.join(base_dir, 'docs', 'definitions', 'Times_Sitelew_Roman_5x5_pixels.csv'),
+            "max_rows": 5,
+            "max_cols": 5,
+            "upm": 1536,
+            "advance_width": 1536,
+            "char_width": 1280,
+            "font_name": "Times Sitelew Roman 5x5 pixels",
+            "out_file": os.path.join(base_dir, 'ttf_fonts', 'Times_Sitelew_Roman_5x5_pixels.ttf'),
+        }
     elif mode == "5x4":
-        csv_path = os.path.join(base_dir, 'docs', 'definitions', 'Times_Sitelew_Roman_5x4_pixels.csv')
-        max_rows = 5
-        max_cols = 4
-        # 4 cols * 256 = 1024 width + 1 col space -> 1280
-        # 5 rows * 256 = 1280 height upm
-        upm = 1280
-        advance_width = 1280
-        char_width = 1024
-        font_name = "Times Sitelew Roman 5x4 pixels"
-        out_file = os.path.join(base_dir, 'ttf_fonts', 'Times_Sitelew_Roman_5x4_pixels.ttf')
+        return {
+            "csv_path": os.path.join(base_dir, 'docs', 'definitions', 'Times_Sitelew_Roman_5x4_pixels.csv'),
+            "max_rows": 5,
+            "max_cols": 4,
+            # 4 cols * 256 = 1024 width + 1 col space -> 1280
+            # 5 rows * 256 = 1280 height upm
+            "upm": 1280,
+            "advance_width": 1280,
+            "char_width": 1024,
+            "font_name": "Times Sitelew Roman 5x4 pixels",
+            "out_file": os.path.join(base_dir, 'ttf_fonts', 'Times_Sitelew_Roman_5x4_pixels.ttf'),
+        }
     else:
-        csv_path = os.path.join(base_dir, 'docs', 'definitions', 'Times_Sitelew_Roman_4x3_pixels.csv')
-        max_rows = 4
-        max_cols = 3
-        # 3 cols * 256 = 768 width + 1 col space -> 1024
-        # 4 rows * 256 = 1024 height upm
-        upm = 1024
-        advance_width = 1024
-        char_width = 768
-        font_name = "Times Sitelew Roman 4x3 pixels"
-        out_file = os.path.join(base_dir, 'ttf_fonts', 'Times_Sitelew_Roman_4x3_pixels.ttf')
+        return {
+            "csv_path": os.path.join(base_dir, 'docs', 'definitions', 'Times_Sitelew_Roman_4x3_pixels.csv'),
+            "max_rows": 4,
+            "max_cols": 3,
+            # 3 cols * 256 = 768 width + 1 col space -> 1024
+            # 4 rows * 256 = 1024 height upm
+            "upm": 1024,
+            "advance_width": 1024,
+            "char_width": 768,
+            "font_name": "Times Sitelew Roman 4x3 pixels",
+            "out_file": os.path.join(base_dir, 'ttf_fonts', 'Times_Sitelew_Roman_4x3_pixels.ttf'),
+        }
+
+def file_digest(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def builder_digest():
+    # Any change to this script or to fontTools may change every glyph
+    digest = hashlib.sha256()
+    with open(os.path.abspath(__file__), 'rb') as f:
+        digest.update(f.read())
+    digest.update(fontTools.version.encode("ascii"))
+    return digest.hexdigest()
+
+def input_digest(csv_path, bitmap_scales):
+    digest = hashlib.sha256()
+    digest.update(builder_digest().encode("ascii"))
+    digest.update(file_digest(csv_path).encode("ascii"))
+    digest.update(",".join(str(s) for s in bitmap_scales).encode("ascii"))
+    return digest.hexdigest()
+
+def load_build_cache(mode, cache_dir=BUILD_CACHE_DIR):
+    # Per size: the stamp of the last build plus compiled outlines and bitmap
+    # images keyed by the glyph's lit cells. Entries from another builder
+    # version are discarded as a whole.
+    empty = {"builder": builder_digest(), "stamp": None, "outlines": {}, "bitmaps": {}}
+    try:
+        with open(os.path.join(cache_dir, f"{mode}.pickle"), 'rb') as f:
+            cache = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        return empty
+    if not isinstance(cache, dict) or cache.get("builder") != empty["builder"]:
+        return empty
+    return cache
+
+def save_build_cache(mode, cache, cache_dir=BUILD_CACHE_DIR):
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, f"{mode}.pickle")
+    with open(path + ".tmp", 'wb') as f:
+        pickle.dump(cache, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(path + ".tmp", path)
+
+class CachedGlyph(Glyph):
+    # A glyph decompiled from bytes of an earlier build. It is expanded so that
+    # maxp/hhea/head can still recalculate their bounds from it, but compiles
+    # back to the cached bytes instead of re-encoding its coordinates.
+    def __init__(self, data):
+        super().__init__(data)
+        self.compiled = data
+        self.expand(None)
+
+    def compile(self, glyfTable, recalcBBoxes=True, **kwargs):
+        return self.compiled
+
+def build_font(mode, bitmap_scales=DEFAULT_BITMAP_SCALES, verify=False, force=False, cache_dir=BUILD_CACHE_DIR):
+    config = get_font_config(mode)
+    csv_path = config["csv_path"]
+    max_rows = config["max_rows"]
+    max_cols = config["max_cols"]
+    upm = config["upm"]
+    advance_width = config["advance_width"]
+    font_name = config["font_name"]
+    out_file = config["out_file"]
+
+    cache = load_build_cache(mode, cache_dir)
+    stamp = input_digest(csv_path, bitmap_scales)
+    if not force and cache["stamp"] is not None and cache["stamp"][0] == stamp \
+            and os.path.exists(out_file) and file_digest(out_file) == cache["stamp"][1]:
+        print(f"Up to date: {out_file}")
+        if verify and bitmap_scales:
+            return verify_bitmaps(out_file, upm, bitmap_scales)
+        return True
 
     chars = parse_csv(csv_path)
     
@@ -119,10 +367,11 @@ def build_font(mode):
     
     glyphs = {}
     metrics = {}
+    glyph_grids = {}
+    outlines = {}
     
     # space
-    pen = TTGlyphPen(None)
-    glyphs['space'] = pen.glyph()
+    glyphs['space'] = CachedGlyph(b"")
     metrics['space'] = (advance_width, 0)
     
     for char, grid in chars.items():
@@ -132,21 +381,28 @@ def build_font(mode):
                 name = f"uni{code:04X}"
             else:
                 name = '.notdef'
-            pen = TTGlyphPen(None)
-            draw_glyph(pen, grid, max_rows, max_cols)
-            tt_glyph = pen.glyph()
-            glyphs[name] = tt_glyph
+            # the outline only depends on the lit cells, so unchanged glyphs
+            # reuse the bytes compiled by an earlier build
+            cells = tuple(get_lit_cells(grid, max_rows, max_cols))
+            data = cache["outlines"].get(cells)
+            if data is None:
+                pen = TTGlyphPen(None)
+                draw_glyph(pen, grid, max_rows, max_cols)
+                data = pen.glyph().compile(None)
+            outlines[cells] = data
+            glyphs[name] = CachedGlyph(data)
+            glyph_grids[name] = grid
             
+            # derive the lsb from the grid; FreeType positions outlines by the hmtx lsb
             lsb = 0
-            if hasattr(tt_glyph, 'xMin'):
-                lsb = tt_glyph.xMin
+            if cells:
+                lsb = min(c for r, c in cells) * CELL_SIZE
             char_advance_width = get_char_width(grid, max_cols, 256)
             metrics[name] = (char_advance_width, lsb)
             
     for name in glyph_order:
         if name not in glyphs:
-            pen = TTGlyphPen(None)
-            glyphs[name] = pen.glyph()
+            glyphs[name] = CachedGlyph(b"")
             metrics[name] = (advance_width, 0)
 
     builder.setupGlyf(glyphs)
@@ -180,14 +436,57 @@ def build_font(mode):
     )
     
     builder.setupPost()
+    bitmaps = {}
+    if bitmap_scales:
+        add_bitmap_strikes(builder.font, glyph_order, glyph_grids, metrics, upm, max_rows, max_cols, bitmap_scales, cache["bitmaps"], bitmaps)
     builder.save(out_file)
     print(f"Successfully built {out_file}")
 
+    # Only keep the entries this build used, so the cache tracks the current CSV
+    cache.update(stamp=(stamp, file_digest(out_file)), outlines=outlines, bitmaps=bitmaps)
+    save_build_cache(mode, cache, cache_dir)
+
+    if verify and bitmap_scales:
+        return verify_bitmaps(out_file, upm, bitmap_scales)
+    return True
+
 def main():
     parser = argparse.ArgumentParser(description="Build Sitelew font from CSV.")
-    parser.add_argument("--size", choices=["4x3", "5x4", "5x5"], default="5x5", help="Font grid size to build")
+    parser.add_argument("--size", choices=FONT_SIZES, default="5x5", help="Font grid size to build")
+    parser.add_argument("--all", action="store_true", help="Build every size in parallel processes")
+    parser.add_argument("--force", action="store_true", help="Rebuild even if the CSV, the builder and the output are unchanged since the last build")
+    parser.add_argument("--cache-dir", default=BUILD_CACHE_DIR, help="Directory holding build stamps and cached per-glyph outlines and bitmaps")
+    parser.add_argument("--bitmap-scales", default=",".join(str(s) for s in DEFAULT_BITMAP_SCALES), help="Comma-separated integer multiples of the native pixel size to embed as bitmap strikes (default: 1,2,3,4)")
+    parser.add_argument("--no-bitmaps", action="store_true", help="Build an outline-only font without embedded bitmap strikes")
+    parser.add_argument("--verify", action="store_true", help="Rasterize outlines and embedded bitmaps with FreeType and check that they match (requires freetype-py)")
     args = parser.parse_args()
-    build_font(args.size)
+
+    bitmap_scales = []
+    if not args.no_bitmaps:
+        try:
+            bitmap_scales = sorted({int(s) for s in args.bitmap_scales.split(",") if s.strip()})
+        except ValueError:
+            parser.error(f"--bitmap-scales must be a comma-separated list of integers, got {args.bitmap_scales!r}")
+        if any(s < 1 for s in bitmap_scales):
+            parser.error("--bitmap-scales values must be positive")
+        # Strike line metrics (the ascender is the ppem) and glyph bearings are
+        # signed bytes in EBLC/EBDT, so no strike may exceed 127 ppem
+        for size in (FONT_SIZES if args.all else [args.size]):
+            config = get_font_config(size)
+            max_scale = 127 // (config["upm"] // CELL_SIZE)
+            if bitmap_scales and bitmap_scales[-1] > max_scale:
+                parser.error(f"--bitmap-scales values for size {size} must be at most {max_scale}, got {bitmap_scales[-1]}")
+
+    if not args.all:
+        if not build_font(args.size, bitmap_scales, args.verify, args.force, args.cache_dir):
+            sys.exit(1)
+        return
+
+    with ProcessPoolExecutor(max_workers=len(FONT_SIZES)) as pool:
+        futures = [pool.submit(build_font, size, bitmap_scales, args.verify, args.force, args.cache_dir) for size in FONT_SIZES]
+        results = [future.result() for future in futures]
+    if not all(results):
+        sys.exit(1)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,301 @@
+import argparse
+import itertools
+import sys
+import time
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
+
+from render_text import (
+    A4_MM, default_font_csv, get_char_width, get_grid_metrics, get_page_metrics,
+    normalize_text, parse_csv, parse_page_mm, prepend_legend, split_lines,
+)
+
+# Page counts here come from a layout-only model of render_text.layout_pages.
+# Breaking a line depends only on how many cells fit in it
+# (line_cells = (width_px - 2 * margin_px) // scale). Where pages break depends
+# only on how many line advances fit on a page
+# (lines_per_page = (height_px - 2 * margin_px) // line_pitch). Wraps are
+# therefore computed once per (variant, line_cells). Every candidate then costs
+# a few bisects per page.
+
+SIZE_ORDER = ["5x5", "5x4", "4x3"] # most readable first
+
+
+class WordWidths(dict):
+    # Width in cells of every distinct word, computed on first use
+    def __init__(self, char_widths):
+        self.char_widths = char_widths
+
+    def __missing__(self, word):
+        width = self[word] = sum(map(self.char_widths.__getitem__, word))
+        return width
+
+
+def prepare_variant(text, size, extreme, compact, transliterate, include_legend):
+    # Everything about the text that does not depend on the page geometry:
+    # per-line prefix sums of token widths (in cells) and a space flag per token.
+    chars = parse_csv(default_font_csv(size))
+    max_rows, max_cols, space_width = get_grid_metrics(size)
+    if include_legend:
+        text = prepend_legend(text)
+    text = normalize_text(text, chars, extreme=extreme, transliterate=transliterate)
+
+    notdef = chars.get('.notdef', [])
+    char_widths = {}
+    for c in set(text):
+        grid = chars.get(c)
+        char_widths[c] = get_char_width(grid if grid is not None else notdef, max_cols)
+    word_widths = WordWidths(char_widths)
+
+    lines = []
+    for line in split_lines(text, compact or extreme):
+        # Same tokens as split_words: a space token between every two pieces of
+        # line.split(' '), with the empty pieces (from runs of spaces) dropped.
+        words = line.split(' ')
+        widths = [space_width] * (2 * len(words) - 1)
+        widths[::2] = [word_widths[word] for word in words]
+        spaces = [False, True] * len(words)
+        spaces.pop()
+        if '' in words:
+            kept = [k for k in range(len(widths)) if k % 2 or words[k // 2]]
+            widths = [widths[k] for k in kept]
+            spaces = [spaces[k] for k in kept]
+        lines.append((list(accumulate(widths, initial=0)), spaces))
+    text_lines = [i for i, (_, spaces) in enumerate(lines) if i > 0 and not all(spaces)]
+
+    # Lines whose width (without leading spaces) fits the line never wrap, so
+    # only the widest lines have to be broken for a given line_cells.
+    widths = []
+    for index, (prefix, spaces) in enumerate(lines):
+        first = 0
+        while first < len(spaces) and spaces[first]:
+            first += 1
+        widths.append((prefix[-1] - prefix[first], index))
+    widths.sort()
+    return {
+        "size": size,
+        "extreme": extreme,
+        "max_rows": max_rows,
+        "min_width": min([space_width, *char_widths.values()]),
+        "lines": lines,
+        "line_widths": [w for w, _ in widths],
+        "lines_by_width": [i for _, i in widths],
+        "text_lines": text_lines,
+        "wraps": {},
+    }
+
+
+def count_line_wraps(prefix, spaces, line_cells, min_width):
+    # Mirrors the word loop of render_text.layout_pages, but jumps over every run
+    # of tokens that fits with one bisect instead of visiting each word. No
+    # token is narrower than min_width cells, so a run never holds more than
+    # line_cells // min_width tokens and the bisect only searches that far
+    # instead of across the rest of the line.
+    n = len(spaces)
+    reach = line_cells // min_width + 1
+    x = 0
+    k = 0
+    wraps = 0
+    while k < n:
+        start = prefix[k]
+        width = prefix[k + 1] - start
+        if x + width <= line_cells and (x or not spaces[k]):
+            end = k + reach
+            k = bisect_right(prefix, start + line_cells - x, k + 2, end if end <= n else n + 1) - 1
+            x += prefix[k] - start
+        elif spaces[k]:
+            k += 1 # leading spaces are skipped and a space that does not fit is dropped
+        else:
+            wraps += 1
+            x = width
+            k += 1
+    return wraps
+
+
+def get_wraps(variant, line_cells):
+    # Returns the line index of every wrap, and the number of line advances
+    # (wraps and explicit newlines) made up to and including each wrap.
+    wraps = variant["wraps"].get(line_cells)
+    if wraps is None:
+        first_long = bisect_right(variant["line_widths"], line_cells)
+        wrap_lines = []
+        for index in sorted(variant["lines_by_width"][first_long:]):
+            prefix, spaces = variant["lines"][index]
+            wrap_lines.extend([index] * count_line_wraps(prefix, spaces, line_cells, variant["min_width"]))
+        wrap_advances = [index + k + 1 for k, index in enumerate(wrap_lines)]
+        wraps = variant["wraps"][line_cells] = (wrap_lines, wrap_advances)
+    return wraps
+
+
+def count_pages(variant, wraps, lines_per_page):
+    # layout_pages starts a new page, once more than lines_per_page advances
+    # have happened since the top of the page, on a wrap or at the start of a
+    # line that is not blank. Each page costs one bisect for the next such
+    # wrap and a binary search for the next such line.
+    wrap_lines, wrap_advances = wraps
+    text_lines = variant["text_lines"]
+    pages = 1
+    page_start = 0
+    while True:
+        target = page_start + lines_per_page + 1
+        k = bisect_left(wrap_advances, target)
+        next_break = wrap_advances[k] if k < len(wrap_advances) else None
+        # advances made before line i: i newlines plus the wraps of earlier lines
+        lo, hi = 0, len(text_lines)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            i = text_lines[mid]
+            if i + bisect_left(wrap_lines, i) >= target:
+                hi = mid
+            else:
+                lo = mid + 1
+        if lo < len(text_lines):
+            i = text_lines[lo]
+            advances = i + bisect_left(wrap_lines, i)
+            if next_break is None or advances < next_break:
+                next_break = advances
+        if next_break is None:
+            return pages
+        pages += 1
+        page_start = next_break
+
+
+def layout_groups(sizes, scales, line_gaps, allow_extreme):
+    # Every combination of parameters except the margin, most readable first:
+    # bigger physical pixels, then the roomier glyph grid, normal over extreme
+    # mode and finally more space between lines.
+    groups = []
+    for size, scale in itertools.product(sizes, scales):
+        for line_gap in line_gaps:
+            groups.append({"size": size, "extreme": False, "scale": scale, "line_gap": line_gap})
+        if allow_extreme:
+            # render_text forces line-gap 0 in extreme mode
+            groups.append({"size": size, "extreme": True, "scale": scale, "line_gap": 0})
+    groups.sort(key=lambda g: (g["scale"], -SIZE_ORDER.index(g["size"]), not g["extreme"], g["line_gap"]), reverse=True)
+    return groups
+
+
+def evaluate(candidate, variants, dpi, page_mm):
+    variant = variants[(candidate["size"], candidate["extreme"])]
+    width_px, height_px, margin_px = get_page_metrics(dpi, candidate["margin_mm"], page_mm)
+    scale = candidate["scale"]
+    line_cells = (width_px - 2 * margin_px) // scale
+    line_pitch = (variant["max_rows"] + candidate["line_gap"]) * scale
+    lines_per_page = (height_px - 2 * margin_px) // line_pitch
+    if line_cells <= 0 or lines_per_page < 0:
+        return None
+    return count_pages(variant, get_wraps(variant, line_cells), lines_per_page)
+
+
+def solve(text, target_pages, dpi=300, page_mm=A4_MM, sizes=SIZE_ORDER, scales=(1, 2, 3, 4),
+          margins=range(0, 21), line_gaps=(0, 1, 2, 3), allow_extreme=True, compact=False,
+          transliterate=True, include_legend=True):
+    # Returns the most readable fitting candidate (with its page count) and the
+    # number of layouts evaluated. Pages never increase as the margin shrinks,
+    # so a group that does not fit with the smallest margin is skipped after a
+    # single layout, and the widest fitting margin is found by bisection.
+    margins = sorted(set(margins))
+    variants = {}
+    evaluated = 0
+    for group in layout_groups(sizes, scales, line_gaps, allow_extreme):
+        key = (group["size"], group["extreme"])
+        if key not in variants:
+            variants[key] = prepare_variant(text, group["size"], group["extreme"], compact, transliterate, include_legend)
+
+        results = {}
+        def fits(index):
+            nonlocal evaluated
+            candidate = dict(group, margin_mm=margins[index])
+            pages = evaluate(candidate, variants, dpi, page_mm)
+            evaluated += 1
+            results[index] = pages
+            return pages is not None and pages <= target_pages
+
+        if not fits(0):
+            continue
+        lo, hi = 0, len(margins) - 1
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if fits(mid):
+                lo = mid
+            else:
+                hi = mid - 1
+        return dict(group, margin_mm=margins[lo], pages=results[lo]), evaluated
+    return None, evaluated
+
+
+def parse_int_list(value):
+    try:
+        result = []
+        for part in value.split(","):
+            if "-" in part:
+                lo, hi = part.split("-")
+                result.extend(range(int(lo), int(hi) + 1))
+            else:
+                result.append(int(part))
+        return result
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected a list like 1,2,4 or 0-20, got {value!r}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Find the most readable render_text.py settings that fit a text onto a given number of pages.")
+    parser.add_argument("--text", required=True, help="Input text file")
+    parser.add_argument("--pages", type=int, default=1, help="Maximum number of pages (default: 1)")
+    parser.add_argument("--page-mm", type=parse_page_mm, default=A4_MM, help="Page or plate size in mm as WIDTHxHEIGHT, or a paper size A0-A6 (default: 210x297, i.e. A4)")
+    parser.add_argument("--dpi", type=int, default=300, help="Printing resolution (DPI), fixed during the search (default: 300)")
+    parser.add_argument("--sizes", default=",".join(SIZE_ORDER), help="Font grid sizes to try (default: 5x5,5x4,4x3)")
+    parser.add_argument("--scales", type=parse_int_list, default=[1, 2, 3, 4], help="Scale factors to try (default: 1-4)")
+    parser.add_argument("--margins", type=parse_int_list, default=list(range(0, 21)), help="Margins in mm to try (default: 0-20)")
+    parser.add_argument("--line-gaps", type=parse_int_list, default=[0, 1, 2, 3], help="Line gaps to try (default: 0-3)")
+    parser.add_argument("--no-extreme", action="store_false", dest="allow_extreme", help="Do not consider --extreme layouts")
+    parser.add_argument("--compact", action="store_true", help="Search compact layouts, as render_text.py --compact")
+    parser.add_argument("--no-legend", action="store_false", dest="include_legend", help="Assume the output is rendered with --no-legend")
+    parser.add_argument("--no-transliterate", action="store_false", dest="transliterate", help="Assume the output is rendered with --no-transliterate")
+    args = parser.parse_args()
+
+    sizes = [s.strip() for s in args.sizes.split(",")]
+    for size in sizes:
+        if size not in SIZE_ORDER:
+            parser.error(f"--sizes: unknown size {size!r}, expected some of {', '.join(SIZE_ORDER)}")
+
+    try:
+        with open(args.text, 'r', encoding='utf-8') as f:
+            text = f.read()
+    except Exception as e:
+        print(f"Error reading {args.text}: {e}")
+        sys.exit(1)
+
+    start = time.perf_counter()
+    best, evaluated = solve(text, args.pages, args.dpi, args.page_mm, sizes, args.scales, args.margins,
+                            args.line_gaps, args.allow_extreme, args.compact, args.transliterate, args.include_legend)
+    elapsed = time.perf_counter() - start
+    print(f"Evaluated {evaluated} candidate layouts in {elapsed:.2f}s")
+
+    if best is None:
+        print(f"No configuration fits {args.text} onto {args.pages} page(s) of {args.page_mm[0]:g}x{args.page_mm[1]:g} mm at {args.dpi} DPI")
+        sys.exit(1)
+
+    command = [f"python render_text.py --text {args.text} --dpi {args.dpi}", f"--size {best['size']}",
+               f"--scale {best['scale']}", f"--margin-mm {best['margin_mm']}"]
+    if tuple(args.page_mm) != A4_MM:
+        command.append(f"--page-mm {args.page_mm[0]:g}x{args.page_mm[1]:g}")
+    if best["extreme"]:
+        command.append("--extreme")
+    else:
+        command.append(f"--line-gap {best['line_gap']}")
+        if args.compact:
+            command.append("--compact")
+    if not args.include_legend:
+        command.append("--no-legend")
+    if not args.transliterate:
+        command.append("--no-transliterate")
+
+    print(f"Best fit: {best['pages']} page(s) with size {best['size']}, scale {best['scale']}, margin {best['margin_mm']} mm, "
+          f"line gap {0 if best['extreme'] else best['line_gap']}{', extreme' if best['extreme'] else ''}")
+    print("Render with:")
+    print("  " + " ".join(command))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,9 @@
 import argparse
 import csv
+import functools
+import hashlib
+import itertools
+import json
 import unicodedata
 from PIL import Image, ImageDraw
 import sys
@@ -35,13 +39,229 @@ def encode_unknown_char(char):
 
 
 def encode_unknown_chars(text, known_chars):
-    result = []
-    for c in text:
-        if c in known_chars:
-            result.append(c)
-        else:
-            result.append(encode_unknown_char(c))
-    return "".join(result)
+    unknown = set(text).difference(known_chars)
+    if not unknown:
+        return text
+    return text.translate({ord(c): encode_unknown_char(c) for c in unknown})
+
+
+A4_MM = (210, 297)
+
+# ISO 216 A series, portrait, in mm
+PAPER_SIZES_MM = {
+    "a0": (841, 1189), "a1": (594, 841), "a2": (420, 594), "a3": (297, 420),
+    "a4": A4_MM, "a5": (148, 210), "a6": (105, 148),
+}
+
+SUBSCRIPT_MAP = {
+    '0': '₀', '1': '₁', '2': '₂', '3': '₃', '4': '₄',
+    '5': '₅', '6': '₆', '7': '₇', '8': '₈', '9': '₉'
+}
+
+# Normalize typographic characters
+TYPOGRAPHIC_REPLACEMENTS = {
+    '—': '-',    # Em dash
+    '–': '-',    # En dash
+    '“': '"',    # Left double quotation mark
+    '”': '"',    # Right double quotation mark
+    '„': '"',    # Double low-9 quotation mark
+    '«': '"',    # Left-pointing double angle quotation mark
+    '»': '"',    # Right-pointing double angle quotation mark
+    '‘': "'",    # Left single quotation mark
+    '’': "'",    # Right single quotation mark
+    '‚': "'",    # Single low-9 quotation mark
+    '‹': "'",    # Single left-pointing angle quotation mark
+    '›': "'",    # Single right-pointing angle quotation mark
+    '…': '...',  # Horizontal ellipsis
+    '. . . .': '....', # Spaced 4-dot ellipsis
+    '. . .': '...', # Spaced horizontal ellipsis
+    '´': "'",    # Acute accent (often used as apostrophe)
+    '\t': '    ', # Tab character to 4 spaces
+    'À': 'A',     # LATIN CAPITAL LETTER A WITH GRAVE
+    'Æ': 'AE',    # LATIN CAPITAL LETTER AE
+    'à': 'a',     # LATIN SMALL LETTER A WITH GRAVE
+    'â': 'a',     # LATIN SMALL LETTER A WITH CIRCUMFLEX
+    'æ': 'ae',    # LATIN SMALL LETTER AE
+    'ç': 'c',     # LATIN SMALL LETTER C WITH CEDILLA
+    'è': 'e',     # LATIN SMALL LETTER E WITH GRAVE
+    'ê': 'e',     # LATIN SMALL LETTER E WITH CIRCUMFLEX
+    'ë': 'e',     # LATIN SMALL LETTER E WITH DIAERESIS
+    'î': 'i',     # LATIN SMALL LETTER I WITH CIRCUMFLEX
+    'ï': 'i',     # LATIN SMALL LETTER I WITH DIAERESIS
+    'ô': 'o',     # LATIN SMALL LETTER O WITH CIRCUMFLEX
+    'ý': 'y',     # LATIN SMALL LETTER Y WITH ACUTE
+    'œ': 'oe',    # LATIN SMALL LIGATURE OE
+    'ű': 'u',     # LATIN SMALL LETTER U WITH DOUBLE ACUTE
+    '\u2007': ' ',# FIGURE SPACE
+    '•': '-',     # BULLET
+    '↑': '^',     # UPWARDS ARROW
+    '∗': '*',     # ASTERISK OPERATOR
+    '⋅': '.',     # DOT OPERATOR
+    '\xa0': ' ',  # NO-BREAK SPACE
+    '§': 'S',     # SECTION SIGN -> S 
+    '¨': '"',     # DIAERESIS -> Quotes 
+    '©': '(c)',   # COPYRIGHT SIGN
+    '\xad': '-',  # SOFT HYPHEN
+    '®': '(r)',   # REGISTERED SIGN
+    '°': '*',     # DEGREE SIGN
+    '±': '+-',    # PLUS-MINUS SIGN
+    '²': '2',     # SUPERSCRIPT TWO
+    '³': '3',     # SUPERSCRIPT THREE
+    '·': '.',     # MIDDLE DOT
+    '¹': '1',     # SUPERSCRIPT ONE
+    'º': 'o',     # MASCULINE ORDINAL INDICATOR
+    '¼': '1/4',   # VULGAR FRACTION ONE QUARTER
+    '×': 'x',     # MULTIPLICATION SIGN
+    'å': 'a',     # LATIN SMALL LETTER A WITH RING ABOVE
+    '÷': '/',     # DIVISION SIGN
+    'ā': 'a',     # LATIN SMALL LETTER A WITH MACRON
+    'Ć': 'C',     # LATIN CAPITAL LETTER C WITH ACUTE
+    'ć': 'c',     # LATIN SMALL LETTER C WITH ACUTE
+    'č': 'c',     # LATIN SMALL LETTER C WITH CARON
+    'ĺ': 'l',     # LATIN SMALL LETTER L WITH ACUTE
+    'ō': 'o',     # LATIN SMALL LETTER O WITH MACRON
+    'Š': 'S',     # LATIN CAPITAL LETTER S WITH CARON
+    'š': 's',     # LATIN SMALL LETTER S WITH CARON
+    'ž': 'z',     # LATIN SMALL LETTER Z WITH CARON
+    'ɓ': 'b',     # LATIN SMALL LETTER B WITH HOOK
+    '˜': '~',     # SMALL TILDE
+    '́': "'",      # COMBINING ACUTE ACCENT
+    '̵': '-',      # COMBINING SHORT STROKE OVERLAY
+    'Π': 'P',     # GREEK CAPITAL LETTER PI
+    'Σ': 'E',     # GREEK CAPITAL LETTER SIGMA -> E (looks sim)
+    'α': 'a',     # GREEK SMALL LETTER ALPHA
+    'γ': 'y',     # GREEK SMALL LETTER GAMMA
+    'η': 'n',     # GREEK SMALL LETTER ETA
+    'π': 'pi',     # GREEK SMALL LETTER PI
+    'ρ': 'p',     # GREEK SMALL LETTER RHO
+    'χ': 'x',     # GREEK SMALL LETTER CHI
+    'І': 'I',     # CYRILLIC CAPITAL LETTER BYELORUSSIAN-UKRAINIAN I
+    'і': 'i',     # CYRILLIC SMALL LETTER BYELORUSSIAN-UKRAINIAN I
+    'ѣ': 'e',     # CYRILLIC SMALL LETTER YAT
+    'ѫ': 'o',     # CYRILLIC SMALL LETTER BIG YUS
+    'ᵢ': 'i',     # LATIN SUBSCRIPT SMALL LETTER I
+    'ṣ': 's',     # LATIN SMALL LETTER S WITH DOT BELOW
+    '\u200b': '', # ZERO WIDTH SPACE
+    '\u200d': '', # ZERO WIDTH JOINER
+    '‐': '-',     # HYPHEN
+    '‑': '-',     # NON-BREAKING HYPHEN
+    '―': '-',     # HORIZONTAL BAR
+    '\u2061': '', # FUNCTION APPLICATION
+    '⁰': '0',     # SUPERSCRIPT ZERO
+    '⁴': '4',     # SUPERSCRIPT FOUR
+    '⁵': '5',     # SUPERSCRIPT FIVE
+    '⁷': '7',     # SUPERSCRIPT SEVEN
+    '⁸': '8',     # SUPERSCRIPT EIGHT
+    '⁹': '9',     # SUPERSCRIPT NINE
+    'ₐ': 'a',     # LATIN SUBSCRIPT SMALL LETTER A
+    'ₓ': 'x',     # LATIN SUBSCRIPT SMALL LETTER X
+    'ₘ': 'm',     # LATIN SUBSCRIPT SMALL LETTER M
+    '€': 'E',     # EURO SIGN
+    '⃣': '',      # COMBINING ENCLOSING KEYCAP
+    '№': 'No',    # NUMERO SIGN
+    '™': 'tm',    # TRADE MARK SIGN
+    '⅓': '1/3',   # VULGAR FRACTION ONE THIRD
+    '←': '<-',    # LEFTWARDS ARROW
+    '→': '->',    # RIGHTWARDS ARROW
+    '↔': '<->',   # LEFT RIGHT ARROW
+    '⇒': '=>',    # RIGHTWARDS DOUBLE ARROW
+    '∆': '^',     # INCREMENT
+    '∑': 'E',     # N-ARY SUMMATION
+    '−': '-',     # MINUS SIGN
+    '√': 'v',     # SQUARE ROOT
+    '∞': 'oo',    # INFINITY
+    '≈': '~',     # ALMOST EQUAL TO
+    '≠': '!=',    # NOT EQUAL TO
+    '≤': '<=',    # LESS-THAN OR EQUAL TO
+    '≥': '>=',    # GREATER-THAN OR EQUAL TO
+    '─': '-',     # BOX DRAWINGS LIGHT HORIZONTAL
+    '│': '|',     # BOX DRAWINGS LIGHT VERTICAL
+    '└': 'L',     # BOX DRAWINGS LIGHT UP AND RIGHT
+    '├': '+',     # BOX DRAWINGS LIGHT VERTICAL AND RIGHT
+    '■': '#',     # BLACK SQUARE
+    '▪': '-',     # BLACK SMALL SQUARE
+    '►': '>',     # BLACK RIGHT-POINTING POINTER
+    '○': 'o',     # WHITE CIRCLE
+    '●': 'O',     # BLACK CIRCLE
+    '◦': 'o',     # WHITE BULLET
+    '★': '*',     # BLACK STAR
+    '☆': '*',     # WHITE STAR
+    '☐': '[]',    # BALLOT BOX
+    '☑': '[x]',   # BALLOT BOX WITH CHECK
+    '♀': 'f',     # FEMALE SIGN
+    '♂': 'm',     # MALE SIGN
+    '♥': '<3',    # BLACK HEART SUIT
+    '♾': 'oo',    # PERMANENT PAPER SIGN
+    '⚡': 'z',     # HIGH VOLTAGE SIGN
+    '✅': '[x]',   # WHITE HEAVY CHECK MARK
+    '✓': 'v',     # CHECK MARK
+    '✔': 'v',     # HEAVY CHECK MARK
+    '❌': 'x',     # CROSS MARK
+    '❤': '<3',    # HEAVY BLACK HEART
+    '➡': '->',    # BLACK RIGHTWARDS ARROW
+    '⟶': '->',    # LONG RIGHTWARDS ARROW
+    '⨁': '+',     # N-ARY CIRCLED PLUS OPERATOR
+    '⭐': '*',     # WHITE MEDIUM STAR
+    '⭕': 'O',     # HEAVY LARGE CIRCLE
+    '、': ',',     # IDEOGRAPHIC COMMA
+    '。': '.',     # IDEOGRAPHIC FULL STOP
+    '《': '<',     # LEFT DOUBLE ANGLE BRACKET
+    '》': '>',     # RIGHT DOUBLE ANGLE BRACKET
+    'Ç': 'C',     # LATIN CAPITAL LETTER C WITH CEDILLA
+    'ò': 'o',     # LATIN SMALL LETTER O WITH GRAVE
+    'ù': 'u',     # LATIN SMALL LETTER U WITH GRAVE
+    'û': 'u',     # LATIN SMALL LETTER U WITH CIRCUMFLEX
+    'ę': 'e',     # LATIN SMALL LETTER E WITH OGONEK
+    'ȃ': 'a',     # LATIN SMALL LETTER A WITH INVERTED BREVE
+    '̀': "'",      # COMBINING GRAVE ACCENT
+    'ό': 'o',     # GREEK SMALL LETTER OMICRON WITH TONOS
+    'ỳ': 'y',     # LATIN SMALL LETTER Y WITH GRAVE
+    '\u2009': ' ',# THIN SPACE
+    '\u202f': ' ',# NARROW NO-BREAK SPACE
+}
+
+
+def default_font_csv(size):
+    import os
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return os.path.join(base_dir, "docs", "definitions", f"Times_Sitelew_Roman_{size}_pixels.csv")
+
+
+def prepend_legend(text):
+    try:
+        import os
+        legend_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "character_legend.txt")
+        with open(legend_path, 'r', encoding='utf-8') as f:
+            legend_text = f.read()
+        import re
+        legend_compact = re.sub(r'\s+', ' ', legend_text).strip()
+        return "[[CHARACTERS LEGEND: " + legend_compact + " CHARACTERS LEGEND END.]]\n\n" + text
+    except Exception as e:
+        print(f"Warning: Could not read character_legend.txt: {e}")
+        return text
+
+
+def normalize_text(text, chars, extreme=False, transliterate=True):
+    text = unicodedata.normalize("NFC", text)
+
+    for k, v in TYPOGRAPHIC_REPLACEMENTS.items():
+        text = text.replace(k, v)
+
+    if extreme:
+        text = text.lower()
+
+    if transliterate:
+        if not is_font_supports_russian(chars):
+            text = transliterate_russian(text)
+        known_chars = set(chars.keys()) | {' ', '\n'}
+        text = encode_unknown_chars(text, known_chars)
+
+    if extreme:
+        for k, v in SUBSCRIPT_MAP.items():
+            text = text.replace(k, v)
+
+    return text
+
 
 def parse_csv(csv_path):
     try:
@@ -106,251 +326,12 @@ def draw_char(draw, grid, x, y, max_rows, max_cols, scale):
                 # draw a rectangle for the pixel (scaled)
                 draw.rectangle([px, py, px + scale - 1, py + scale - 1], fill=0)
 
-def main():
-    parser = argparse.ArgumentParser(description="Render text into a pixel-precise A4 image.")
-    parser.add_argument("--text", required=True, help="Input text file")
-    parser.add_argument("--out", default="output.png", help="Output PNG file")
-    parser.add_argument("--dpi", type=int, default=300, help="Printing resolution (DPI)")
-    parser.add_argument("--font-csv", default=None, help="Font CSV file, defaults to the size-appropriate CSV in docs/definitions directory if unspecified.")
-    parser.add_argument("--scale", type=int, default=1, help="Scale factor (e.g. 2 means 2x2 pixels per cell)")
-    parser.add_argument("--size", choices=["4x3", "5x4", "5x5"], default="5x5", help="Font grid size to use (for max cols/rows)")
-    parser.add_argument("--margin-mm", type=int, default=10, help="Margin in mm")
-    parser.add_argument("--line-gap", type=int, default=1, help="Gap between lines in pixels")
-    parser.add_argument("--compact", action="store_true", help="Compact mode: ignore newlines and continuous spaces to save space")
-    parser.add_argument("--extreme", action="store_true", help="Extreme mode: assumes compact, converts to lowercase, converts digits to subscripts, and sets line-gap to 1 (between letters, basically overlapping lines for max density)")
-    parser.add_argument("--include_legend", default=True, type=lambda x: (str(x).lower() in ['true', '1', 'yes']), help="Include legend text character_legend.txt at the start of output (default: True)")
-    parser.add_argument("--no-legend", action="store_false", dest="include_legend", help="Disable the inclusion of character_legend.txt at the start of output")
-    parser.add_argument("--transliterate", default=True, type=lambda x: (str(x).lower() in ['true', '1', 'yes']), help="Convert unsupported characters to Latin equivalents. Russian uses a reversible transliteration; other scripts are encoded as hex codes like [\\u0436] (default: True)")
-    parser.add_argument("--no-transliterate", action="store_false", dest="transliterate", help="Disable transliteration of unsupported characters")
-    args = parser.parse_args()
-
-    if args.font_csv is None:
-        import os
-        base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        if args.size == "4x3":
-            args.font_csv = os.path.join(base_dir, "docs", "definitions", "Times_Sitelew_Roman_4x3_pixels.csv")
-        elif args.size == "5x5":
-            args.font_csv = os.path.join(base_dir, "docs", "definitions", "Times_Sitelew_Roman_5x5_pixels.csv")
-        else:
-            args.font_csv = os.path.join(base_dir, "docs", "definitions", "Times_Sitelew_Roman_5x4_pixels.csv")
-
-    if args.extreme:
-        args.compact = True
-        # Lowercase letters typically occupy rows 1 to 4 (4 pixels tall, row 0 is empty).
-        # To leave exactly 1 pixel between them, we need y to advance by 5 pixels.
-        # Since max_rows is 5, line_gap = 0 will result in exactly 5 pixels per line, leaving 1 empty pixel.
-        args.line_gap = 0
-
-    try:
-        with open(args.text, 'r', encoding='utf-8') as f:
-            text = f.read()
-    except Exception as e:
-        print(f"Error reading {args.text}: {e}")
-        sys.exit(1)
-
-    if args.include_legend:
-        try:
-            import os
-            legend_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "character_legend.txt")
-            with open(legend_path, 'r', encoding='utf-8') as f:
-                legend_text = f.read()
-            import re
-            legend_compact = re.sub(r'\s+', ' ', legend_text).strip()
-            text = "[[CHARACTERS LEGEND: " + legend_compact + " CHARACTERS LEGEND END.]]\n\n" + text
-        except Exception as e:
-            print(f"Warning: Could not read character_legend.txt: {e}")
-
-    # Normalize typographic characters
-    typographic_replacements = {
-        '—': '-',    # Em dash
-        '–': '-',    # En dash
-        '“': '"',    # Left double quotation mark
-        '”': '"',    # Right double quotation mark
-        '„': '"',    # Double low-9 quotation mark
-        '«': '"',    # Left-pointing double angle quotation mark
-        '»': '"',    # Right-pointing double angle quotation mark
-        '‘': "'",    # Left single quotation mark
-        '’': "'",    # Right single quotation mark
-        '‚': "'",    # Single low-9 quotation mark
-        '‹': "'",    # Single left-pointing angle quotation mark
-        '›': "'",    # Single right-pointing angle quotation mark
-        '…': '...',  # Horizontal ellipsis
-        '. . . .': '....', # Spaced 4-dot ellipsis
-        '. . .': '...', # Spaced horizontal ellipsis
-        '´': "'",    # Acute accent (often used as apostrophe)
-        '\t': '    ', # Tab character to 4 spaces
-        'À': 'A',     # LATIN CAPITAL LETTER A WITH GRAVE
-        'Æ': 'AE',    # LATIN CAPITAL LETTER AE
-        'à': 'a',     # LATIN SMALL LETTER A WITH GRAVE
-        'â': 'a',     # LATIN SMALL LETTER A WITH CIRCUMFLEX
-        'æ': 'ae',    # LATIN SMALL LETTER AE
-        'ç': 'c',     # LATIN SMALL LETTER C WITH CEDILLA
-        'è': 'e',     # LATIN SMALL LETTER E WITH GRAVE
-        'ê': 'e',     # LATIN SMALL LETTER E WITH CIRCUMFLEX
-        'ë': 'e',     # LATIN SMALL LETTER E WITH DIAERESIS
-        'î': 'i',     # LATIN SMALL LETTER I WITH CIRCUMFLEX
-        'ï': 'i',     # LATIN SMALL LETTER I WITH DIAERESIS
-        'ô': 'o',     # LATIN SMALL LETTER O WITH CIRCUMFLEX
-        'ý': 'y',     # LATIN SMALL LETTER Y WITH ACUTE
-        'œ': 'oe',    # LATIN SMALL LIGATURE OE
-        'ű': 'u',     # LATIN SMALL LETTER U WITH DOUBLE ACUTE
-        '\u2007': ' ',# FIGURE SPACE
-        '•': '-',     # BULLET
-        '↑': '^',     # UPWARDS ARROW
-        '∗': '*',     # ASTERISK OPERATOR
-        '⋅': '.',     # DOT OPERATOR
-        '\xa0': ' ',  # NO-BREAK SPACE
-        '§': 'S',     # SECTION SIGN -> S 
-        '¨': '"',     # DIAERESIS -> Quotes 
-        '©': '(c)',   # COPYRIGHT SIGN
-        '\xad': '-',  # SOFT HYPHEN
-        '®': '(r)',   # REGISTERED SIGN
-        '°': '*',     # DEGREE SIGN
-        '±': '+-',    # PLUS-MINUS SIGN
-        '²': '2',     # SUPERSCRIPT TWO
-        '³': '3',     # SUPERSCRIPT THREE
-        '·': '.',     # MIDDLE DOT
-        '¹': '1',     # SUPERSCRIPT ONE
-        'º': 'o',     # MASCULINE ORDINAL INDICATOR
-        '¼': '1/4',   # VULGAR FRACTION ONE QUARTER
-        '×': 'x',     # MULTIPLICATION SIGN
-        'å': 'a',     # LATIN SMALL LETTER A WITH RING ABOVE
-        '÷': '/',     # DIVISION SIGN
-        'ā': 'a',     # LATIN SMALL LETTER A WITH MACRON
-        'Ć': 'C',     # LATIN CAPITAL LETTER C WITH ACUTE
-        'ć': 'c',     # LATIN SMALL LETTER C WITH ACUTE
-        'č': 'c',     # LATIN SMALL LETTER C WITH CARON
-        'ĺ': 'l',     # LATIN SMALL LETTER L WITH ACUTE
-        'ō': 'o',     # LATIN SMALL LETTER O WITH MACRON
-        'Š': 'S',     # LATIN CAPITAL LETTER S WITH CARON
-        'š': 's',     # LATIN SMALL LETTER S WITH CARON
-        'ž': 'z',     # LATIN SMALL LETTER Z WITH CARON
-        'ɓ': 'b',     # LATIN SMALL LETTER B WITH HOOK
-        '˜': '~',     # SMALL TILDE
-        '́': "'",      # COMBINING ACUTE ACCENT
-        '̵': '-',      # COMBINING SHORT STROKE OVERLAY
-        'Π': 'P',     # GREEK CAPITAL LETTER PI
-        'Σ': 'E',     # GREEK CAPITAL LETTER SIGMA -> E (looks sim)
-        'α': 'a',     # GREEK SMALL LETTER ALPHA
-        'γ': 'y',     # GREEK SMALL LETTER GAMMA
-        'η': 'n',     # GREEK SMALL LETTER ETA
-        'π': 'pi',     # GREEK SMALL LETTER PI
-        'ρ': 'p',     # GREEK SMALL LETTER RHO
-        'χ': 'x',     # GREEK SMALL LETTER CHI
-        'І': 'I',     # CYRILLIC CAPITAL LETTER BYELORUSSIAN-UKRAINIAN I
-        'і': 'i',     # CYRILLIC SMALL LETTER BYELORUSSIAN-UKRAINIAN I
-        'ѣ': 'e',     # CYRILLIC SMALL LETTER YAT
-        'ѫ': 'o',     # CYRILLIC SMALL LETTER BIG YUS
-        'ᵢ': 'i',     # LATIN SUBSCRIPT SMALL LETTER I
-        'ṣ': 's',     # LATIN SMALL LETTER S WITH DOT BELOW
-        '\u200b': '', # ZERO WIDTH SPACE
-        '\u200d': '', # ZERO WIDTH JOINER
-        '‐': '-',     # HYPHEN
-        '‑': '-',     # NON-BREAKING HYPHEN
-        '―': '-',     # HORIZONTAL BAR
-        '\u2061': '', # FUNCTION APPLICATION
-        '⁰': '0',     # SUPERSCRIPT ZERO
-        '⁴': '4',     # SUPERSCRIPT FOUR
-        '⁵': '5',     # SUPERSCRIPT FIVE
-        '⁷': '7',     # SUPERSCRIPT SEVEN
-        '⁸': '8',     # SUPERSCRIPT EIGHT
-        '⁹': '9',     # SUPERSCRIPT NINE
-        'ₐ': 'a',     # LATIN SUBSCRIPT SMALL LETTER A
-        'ₓ': 'x',     # LATIN SUBSCRIPT SMALL LETTER X
-        'ₘ': 'm',     # LATIN SUBSCRIPT SMALL LETTER M
-        '€': 'E',     # EURO SIGN
-        '⃣': '',      # COMBINING ENCLOSING KEYCAP
-        '№': 'No',    # NUMERO SIGN
-        '™': 'tm',    # TRADE MARK SIGN
-        '⅓': '1/3',   # VULGAR FRACTION ONE THIRD
-        '←': '<-',    # LEFTWARDS ARROW
-        '→': '->',    # RIGHTWARDS ARROW
-        '↔': '<->',   # LEFT RIGHT ARROW
-        '⇒': '=>',    # RIGHTWARDS DOUBLE ARROW
-        '∆': '^',     # INCREMENT
-        '∑': 'E',     # N-ARY SUMMATION
-        '−': '-',     # MINUS SIGN
-        '√': 'v',     # SQUARE ROOT
-        '∞': 'oo',    # INFINITY
-        '≈': '~',     # ALMOST EQUAL TO
-        '≠': '!=',    # NOT EQUAL TO
-        '≤': '<=',    # LESS-THAN OR EQUAL TO
-        '≥': '>=',    # GREATER-THAN OR EQUAL TO
-        '─': '-',     # BOX DRAWINGS LIGHT HORIZONTAL
-        '│': '|',     # BOX DRAWINGS LIGHT VERTICAL
-        '└': 'L',     # BOX DRAWINGS LIGHT UP AND RIGHT
-        '├': '+',     # BOX DRAWINGS LIGHT VERTICAL AND RIGHT
-        '■': '#',     # BLACK SQUARE
-        '▪': '-',     # BLACK SMALL SQUARE
-        '►': '>',     # BLACK RIGHT-POINTING POINTER
-        '○': 'o',     # WHITE CIRCLE
-        '●': 'O',     # BLACK CIRCLE
-        '◦': 'o',     # WHITE BULLET
-        '★': '*',     # BLACK STAR
-        '☆': '*',     # WHITE STAR
-        '☐': '[]',    # BALLOT BOX
-        '☑': '[x]',   # BALLOT BOX WITH CHECK
-        '♀': 'f',     # FEMALE SIGN
-        '♂': 'm',     # MALE SIGN
-        '♥': '<3',    # BLACK HEART SUIT
-        '♾': 'oo',    # PERMANENT PAPER SIGN
-        '⚡': 'z',     # HIGH VOLTAGE SIGN
-        '✅': '[x]',   # WHITE HEAVY CHECK MARK
-        '✓': 'v',     # CHECK MARK
-        '✔': 'v',     # HEAVY CHECK MARK
-        '❌': 'x',     # CROSS MARK
-        '❤': '<3',    # HEAVY BLACK HEART
-        '➡': '->',    # BLACK RIGHTWARDS ARROW
-        '⟶': '->',    # LONG RIGHTWARDS ARROW
-        '⨁': '+',     # N-ARY CIRCLED PLUS OPERATOR
-        '⭐': '*',     # WHITE MEDIUM STAR
-        '⭕': 'O',     # HEAVY LARGE CIRCLE
-        '、': ',',     # IDEOGRAPHIC COMMA
-        '。': '.',     # IDEOGRAPHIC FULL STOP
-        '《': '<',     # LEFT DOUBLE ANGLE BRACKET
-        '》': '>',     # RIGHT DOUBLE ANGLE BRACKET
-        'Ç': 'C',     # LATIN CAPITAL LETTER C WITH CEDILLA
-        'ò': 'o',     # LATIN SMALL LETTER O WITH GRAVE
-        'ù': 'u',     # LATIN SMALL LETTER U WITH GRAVE
-        'û': 'u',     # LATIN SMALL LETTER U WITH CIRCUMFLEX
-        'ę': 'e',     # LATIN SMALL LETTER E WITH OGONEK
-        'ȃ': 'a',     # LATIN SMALL LETTER A WITH INVERTED BREVE
-        '̀': "'",      # COMBINING GRAVE ACCENT
-        'ό': 'o',     # GREEK SMALL LETTER OMICRON WITH TONOS
-        'ỳ': 'y',     # LATIN SMALL LETTER Y WITH GRAVE
-        '\u2009': ' ',# THIN SPACE
-        '\u202f': ' ',# NARROW NO-BREAK SPACE
-    }
-
-    text = unicodedata.normalize("NFC", text)
-
-    for k, v in typographic_replacements.items():
-        text = text.replace(k, v)
-
-    if args.extreme:
-        text = text.lower()
-
-    chars = parse_csv(args.font_csv)
-
-    if args.transliterate:
-        if not is_font_supports_russian(chars):
-            text = transliterate_russian(text)
-        known_chars = set(chars.keys()) | {' ', '\n'}
-        text = encode_unknown_chars(text, known_chars)
-
-    if args.extreme:
-        subscript_map = {
-            '0': '₀', '1': '₁', '2': '₂', '3': '₃', '4': '₄',
-            '5': '₅', '6': '₆', '7': '₇', '8': '₈', '9': '₉'
-        }
-        for k, v in subscript_map.items():
-            text = text.replace(k, v)
-
-    if args.size == "5x5":
+def get_grid_metrics(size):
+    if size == "5x5":
         max_rows = 5
         max_cols = 5
         space_width = 3
-    elif args.size == "5x4":
+    elif size == "5x4":
         max_rows = 5
         max_cols = 4
         # Since get_char_width already appends a 1-pixel gap after each letter,
@@ -361,108 +342,413 @@ def main():
         max_cols = 3
         # Advancing by 2 here yields a total visual gap of 1 + 2 = 3 pixels.
         space_width = 2
+    return max_rows, max_cols, space_width
 
-    # Calculate dimensions for A4 (210 x 297 mm)
-    width_px = int((210 / 25.4) * args.dpi)
-    height_px = int((297 / 25.4) * args.dpi)
-    margin_px = int((args.margin_mm / 25.4) * args.dpi)
-    
-    images = []
-    
-    img = Image.new("1", (width_px, height_px), color=1) # 1-bit pixels, white background
-    draw = ImageDraw.Draw(img)
+def parse_page_mm(value):
+    if value.lower() in PAPER_SIZES_MM:
+        return PAPER_SIZES_MM[value.lower()]
+    try:
+        width_mm, height_mm = (float(v) for v in value.lower().split("x"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected WIDTHxHEIGHT in mm, e.g. 210x297, or a paper size A0-A6, got {value!r}")
+    return width_mm, height_mm
+
+def get_page_metrics(dpi, margin_mm, page_mm=A4_MM):
+    # Calculate dimensions for the page (A4, 210 x 297 mm, by default)
+    width_px = int((page_mm[0] / 25.4) * dpi)
+    height_px = int((page_mm[1] / 25.4) * dpi)
+    margin_px = int((margin_mm / 25.4) * dpi)
+    return width_px, height_px, margin_px
+
+def split_words(line, compact):
+    # Yields the words of a line, with a " " token for every space (only one
+    # per run of spaces in compact mode)
+    current_word = []
+    after_space = False
+    for c in line:
+        if c == ' ':
+            if current_word:
+                yield "".join(current_word)
+                current_word = []
+                after_space = False
+            # Only yield a space if we didn't just yield one
+            # OR if not compact/extreme.
+            if not (compact and after_space):
+                yield " "
+                after_space = True
+        else:
+            current_word.append(c)
+    if current_word:
+        yield "".join(current_word)
 
+def split_lines(text, compact):
+    if compact:
+        # Collapse all whitespace, including newlines, into single spaces
+        return [" ".join(text.split())]
+    return text.split('\n')
+
+def layout_source(text, compact):
+    # The string layout_pages walks through; page index offsets point into it
+    if compact:
+        return "\n".join(split_lines(text, compact))
+    return text
+
+def layout_lines(text, chars, max_rows, max_cols, space_width, width_px, height_px, margin_px, scale=1, line_gap=1, compact=False,
+                 start=(0, False), page_starts=None):
+    # The layout behind layout_pages, one visual line at a time: yields the
+    # (x, y, grid) glyph placements of every line that has any, in order of
+    # y, and None wherever a new page starts.
+    #
+    # Every page starts with the cursor at the top-left margin, so the layout
+    # state at a page start is just an offset into layout_source(text) plus
+    # whether the page began by wrapping the word at that offset (which is then
+    # placed without checking its width again). Laying out from such a start
+    # reproduces the following pages exactly. If page_starts is a list, the
+    # start of every page is appended to it.
+    offset, wrapped = start
+    if page_starts is not None:
+        page_starts.append((offset, wrapped))
+    placed = []
     x = margin_px
     y = margin_px
     line_height = max_rows
+    notdef = chars.get('.notdef', [])
     
-    def get_word_width(word):
-        w = 0
-        for c in word:
-            if c == ' ':
-                w += space_width
-                continue
+    # (grid, advance) per character, so each glyph grid is measured once
+    glyphs = {' ': (None, space_width)}
+
+    def get_glyph(c):
+        glyph = glyphs.get(c)
+        if glyph is None:
             grid = chars.get(c)
             if grid is None:
-                grid = chars.get('.notdef', [])
-            w += get_char_width(grid, max_cols)
-        return w * args.scale
+                grid = notdef
+            glyph = glyphs[c] = (grid, get_char_width(grid, max_cols))
+        return glyph
 
-    if args.compact:
-        # Collapse all whitespace, including newlines, into single spaces
-        text = " ".join(text.split())
-        lines = [text]
-    else:
-        lines = text.split('\n')
+    def get_word_width(word):
+        w = 0
+        for c in word:
+            w += get_glyph(c)[1]
+        return w * scale
 
+    lines = split_lines(text, compact) if offset == 0 else layout_source(text, compact)[offset:].split('\n')
     for line in lines:
-        words = []
-        current_word = []
-        for c in line:
-            if c == ' ':
-                if current_word:
-                    words.append("".join(current_word))
-                    current_word = []
-                # Only append space if we didn't just append a space 
-                # OR if not compact/extreme.
-                if args.compact:
-                    if not words or words[-1] != " ":
-                        words.append(" ")
-                else:
-                    words.append(" ")
-            else:
-                current_word.append(c)
-        if current_word:
-            words.append("".join(current_word))
-            
-        for word in words:
+        if y > height_px - margin_px and line.strip(' '):
+            # Explicit newlines ran past the bottom margin; continue on a new
+            # page rather than drawing the line off the page.
+            yield None
+            y = margin_px
+            if page_starts is not None:
+                page_starts.append((offset, False))
+        for word in split_words(line, compact):
+            word_offset = offset
+            offset += len(word)
             word_width = get_word_width(word)
             if word == " " and x == margin_px:
                 continue # Skip leading spaces on wrapped lines
                 
-            if x + word_width > width_px - margin_px:
+            if wrapped:
+                wrapped = False
+            elif x + word_width > width_px - margin_px:
                 if word == " ":
                     continue # single space does not need to wrap
                 # Line wrap
+                if placed:
+                    yield placed
+                    placed = []
                 x = margin_px
-                y += (line_height + args.line_gap) * args.scale
+                y += (line_height + line_gap) * scale
                 if y > height_px - margin_px:
-                    images.append(img)
-                    img = Image.new("1", (width_px, height_px), color=1)
-                    draw = ImageDraw.Draw(img)
+                    yield None
                     x = margin_px
                     y = margin_px
+                    if page_starts is not None:
+                        page_starts.append((word_offset, True))
             if word == " ":
-                x += space_width * args.scale
+                x += space_width * scale
             else:
                 for c in word:
-                    grid = chars.get(c)
-                    if grid is None:
-                        grid = chars.get('.notdef', [])
-                        
-                    c_w = get_char_width(grid, max_cols)
-                    draw_char(draw, grid, x, y, max_rows, max_cols, args.scale)
-                    x += c_w * args.scale
+                    grid, advance = get_glyph(c)
+                    placed.append((x, y, grid))
+                    x += advance * scale
                     
         # explicit newline
+        if placed:
+            yield placed
+            placed = []
+        offset += 1
         x = margin_px
-        y += (line_height + args.line_gap) * args.scale
+        y += (line_height + line_gap) * scale
+
+def page_lines(chunks):
+    # Yields one iterator per page over the lines of layout_lines on that
+    # page. As with itertools.groupby, a page has to be used before the next
+    # one is requested; whatever is left of it is skipped.
+    chunks = iter(chunks)
+    done = False
+
+    def lines():
+        nonlocal done
+        for chunk in chunks:
+            if chunk is None:
+                return
+            yield chunk
+        done = True
+
+    while not done:
+        page = lines()
+        yield page
+        for _ in page:
+            pass
+
+def layout_pages(text, chars, max_rows, max_cols, space_width, width_px, height_px, margin_px, scale=1, line_gap=1, compact=False,
+                 start=(0, False), page_starts=None, by_line=False):
+    # Yields every page as a list of (x, y, grid) glyph placements in image
+    # pixels. Nothing is rasterized here, so the raster and vector backends
+    # share exactly the same layout. With by_line, every page is instead an
+    # iterator over its lines (see page_lines), so a page never has to be
+    # held in memory at once. start and page_starts are as in layout_lines.
+    chunks = layout_lines(text, chars, max_rows, max_cols, space_width, width_px, height_px, margin_px,
+                          scale, line_gap, compact, start, page_starts)
+    if by_line:
+        yield from page_lines(chunks)
+        return
+    page = []
+    for chunk in chunks:
+        if chunk is None:
+            yield page
+            page = []
+        else:
+            page.extend(chunk)
+    yield page
 
-    images.append(img)
-    
+def parse_page_range(value):
+    try:
+        first, _, last = value.partition("-")
+        first = int(first)
+        last = int(last) if last else first
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected a page or a range of pages, e.g. 412 or 410-415, got {value!r}")
+    if first < 1 or last < first:
+        raise argparse.ArgumentTypeError(f"invalid page range {value!r}")
+    return first, last
+
+def page_index_key(text, font_csv, layout_args):
+    # The index is only valid for the same normalized text, font and layout
+    digest = hashlib.sha256()
+    digest.update(text.encode("utf-8"))
+    with open(font_csv, 'rb') as f:
+        digest.update(f.read())
+    digest.update(json.dumps(layout_args, sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()
+
+def load_page_index(path, key):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(index, dict) or index.get("key") != key:
+        return None
+    return [(offset, wrapped) for offset, wrapped in index["pages"]]
+
+def build_page_index(path, key, pages):
+    # Layout-only pass: consume the layout and keep where every page starts
+    page_starts = []
+    for _ in pages(page_starts=page_starts):
+        pass
+    try:
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({"key": key, "pages": page_starts}, f, separators=(",", ":"))
+    except OSError as e:
+        # Still render from the page starts in memory; the next run re-indexes
+        print(f"Warning: Could not write page index {path}: {e}")
+    else:
+        print(f"Indexed {len(page_starts)} pages in {path}")
+    return page_starts
+
+def rasterize_page(page, width_px, height_px, max_rows, max_cols, scale):
+    img = Image.new("1", (width_px, height_px), color=1) # 1-bit pixels, white background
+    draw = ImageDraw.Draw(img)
+    for x, y, grid in page:
+        draw_char(draw, grid, x, y, max_rows, max_cols, scale)
+    return img
+
+def encode_image(img, out_name, save_kwargs):
+    img.save(out_name, **save_kwargs)
+    return out_name
+
+def save_images(images, out, size_label, encode_threads=2, queue_depth=4, compress_level=None, first_page=1, page_count=None):
+    # Pages are encoded on a thread pool while the caller keeps laying out and
+    # rasterizing the next ones (zlib releases the GIL). At most queue_depth
+    # finished pages wait for or sit in an encoder, which bounds memory.
     import os
-    base, ext = os.path.splitext(args.out)
+    import threading
+    from collections import deque
+    from concurrent.futures import ThreadPoolExecutor
+
+    base, ext = os.path.splitext(out)
     if not ext:
         ext = ".png"
+    save_kwargs = {} if compress_level is None else {"compress_level": compress_level}
+    slots = threading.BoundedSemaphore(queue_depth)
+    pending = deque()
+
+    def submit(img, out_name):
+        slots.acquire()
+        future = pool.submit(encode_image, img, out_name, save_kwargs)
+        future.add_done_callback(lambda f: slots.release())
+        pending.append(future)
+
+    def report(wait):
+        # Report in page order
+        while pending and (wait or pending[0].done()):
+            print(f"Saved to {pending.popleft().result()} {size_label}")
+
+    with ThreadPoolExecutor(max_workers=encode_threads) as pool:
+        if page_count is not None:
+            # Rendering a range of a document whose page count is known, so
+            # pages get the same names as in a full render.
+            for number, img in enumerate(images, start=first_page):
+                submit(img, out if page_count == 1 else f"{base}_{number}{ext}")
+                report(wait=False)
+            report(wait=True)
+            return
+
+        # A lone page is saved under the plain output name, so the first page
+        # is held back until we know whether a second one follows.
+        first = None
+        count = 0
+        for img in images:
+            count += 1
+            if count == 1:
+                first = img
+                continue
+            if first is not None:
+                submit(first, f"{base}_1{ext}")
+                first = None
+            submit(img, f"{base}_{count}{ext}")
+            report(wait=False)
+        if first is not None:
+            submit(first, out)
+        report(wait=True)
+
+def main():
+    parser = argparse.ArgumentParser(description="Render text into pixel-precise page images (A4 by default).")
+    parser.add_argument("--text", required=True, help="Input text file")
+    parser.add_argument("--out", default="output.png", help="Output PNG file")
+    parser.add_argument("--dpi", type=int, default=300, help="Printing resolution (DPI)")
+    parser.add_argument("--font-csv", default=None, help="Font CSV file, defaults to the size-appropriate CSV in docs/definitions directory if unspecified.")
+    parser.add_argument("--scale", type=int, default=1, help="Scale factor (e.g. 2 means 2x2 pixels per cell)")
+    parser.add_argument("--size", choices=["4x3", "5x4", "5x5"], default="5x5", help="Font grid size to use (for max cols/rows)")
+    parser.add_argument("--page-mm", type=parse_page_mm, default=A4_MM, help="Page or canvas size in mm as WIDTHxHEIGHT, or a paper size A0-A6 (default: 210x297, i.e. A4)")
+    parser.add_argument("--margin-mm", type=int, default=10, help="Margin in mm")
+    parser.add_argument("--line-gap", type=int, default=1, help="Gap between lines in pixels")
+    parser.add_argument("--compact", action="store_true", help="Compact mode: ignore newlines and continuous spaces to save space")
+    parser.add_argument("--extreme", action="store_true", help="Extreme mode: assumes compact, converts to lowercase, converts digits to subscripts, and sets line-gap to 1 (between letters, basically overlapping lines for max density)")
+    parser.add_argument("--include_legend", default=True, type=lambda x: (str(x).lower() in ['true', '1', 'yes']), help="Include legend text character_legend.txt at the start of output (default: True)")
+    parser.add_argument("--no-legend", action="store_false", dest="include_legend", help="Disable the inclusion of character_legend.txt at the start of output")
+    parser.add_argument("--transliterate", default=True, type=lambda x: (str(x).lower() in ['true', '1', 'yes']), help="Convert unsupported characters to Latin equivalents. Russian uses a reversible transliteration; other scripts are encoded as hex codes like [\\u0436] (default: True)")
+    parser.add_argument("--no-transliterate", action="store_false", dest="transliterate", help="Disable transliteration of unsupported characters")
+    parser.add_argument("--encode-threads", type=int, default=2, help="Threads encoding finished pages while the next ones are laid out (default: 2)")
+    parser.add_argument("--encode-queue", type=int, default=4, help="Maximum number of finished pages waiting to be encoded (default: 4)")
+    parser.add_argument("--compress-level", type=int, choices=range(10), default=None, metavar="0-9", help="PNG zlib compression level; lower is faster, higher is smaller (default: Pillow's default, 6)")
+    output_format = parser.add_mutually_exclusive_group()
+    output_format.add_argument("--vector", choices=["svg", "svgz", "pdf"], default=None, help="Write resolution-independent vector output instead of PNG images: one SVG (or gzipped SVG) per page, or a single multi-page PDF")
+    output_format.add_argument("--toolpath", choices=["gcode", "svg"], default=None, help="Write an engraving toolpath instead of images: G-code for a laser or CNC engraver, or an SVG preview of strokes and travel moves")
+    parser.add_argument("--toolpath-order", choices=["nearest", "boustrophedon"], default="nearest", help="Stroke ordering: nearest neighbour refined by 2-opt, or row by row in alternating directions (default: nearest)")
+    parser.add_argument("--engrave-feed", type=float, default=1000, help="Engraving speed in mm/min (default: 1000)")
+    parser.add_argument("--travel-feed", type=float, default=3000, help="Travel (rapid) speed in mm/min, used for the time estimate (default: 3000)")
+    parser.add_argument("--accel", type=float, default=1000, help="Machine acceleration in mm/s^2, used for the time estimate (default: 1000)")
+    parser.add_argument("--power", type=int, default=1000, help="G-code S value: laser power, or spindle speed with --plunge-depth-mm (default: 1000)")
+    parser.add_argument("--plunge-depth-mm", type=float, default=None, help="CNC mode: plunge this deep for every stroke and retract to --safe-z-mm in between, instead of switching a laser")
+    parser.add_argument("--safe-z-mm", type=float, default=1.0, help="Retract height for --plunge-depth-mm (default: 1.0)")
+    output_format.add_argument("--tiles", choices=["tiff", "png"], default=None, help="Rasterize tile by tile for canvases too large for one in-memory image: one tiled TIFF per page, or one PNG per tile")
+    parser.add_argument("--tile-px", type=int, default=2048, help="Tile edge length in pixels for --tiles, a multiple of 16 (default: 2048)")
+    parser.add_argument("--pages", type=parse_page_range, default=None, help="Render only these pages, e.g. 412 or 410-415, with the same output as a full render. Uses a page index next to the input, built by a layout-only pass on first use")
+    parser.add_argument("--page-index", default=None, help="Page index file used by --pages (default: <text>.pageindex.json)")
+    args = parser.parse_args()
+
+    if args.font_csv is None:
+        args.font_csv = default_font_csv(args.size)
+    if args.encode_threads < 1 or args.encode_queue < 1:
+        parser.error("--encode-threads and --encode-queue must be at least 1")
+    if args.tile_px < 16 or args.tile_px % 16:
+        parser.error("--tile-px must be a positive multiple of 16")
+    if min(args.engrave_feed, args.travel_feed, args.accel) <= 0:
+        parser.error("--engrave-feed, --travel-feed and --accel must be positive")
 
-    if len(images) == 1:
-        images[0].save(args.out)
-        print(f"Saved to {args.out} (Size: {width_px}x{height_px}, DPI: {args.dpi})")
+    if args.extreme:
+        args.compact = True
+        # Lowercase letters typically occupy rows 1 to 4 (4 pixels tall, row 0 is empty).
+        # To leave exactly 1 pixel between them, we need y to advance by 5 pixels.
+        # Since max_rows is 5, line_gap = 0 will result in exactly 5 pixels per line, leaving 1 empty pixel.
+        args.line_gap = 0
+
+    try:
+        with open(args.text, 'r', encoding='utf-8') as f:
+            text = f.read()
+    except Exception as e:
+        print(f"Error reading {args.text}: {e}")
+        sys.exit(1)
+
+    if args.include_legend:
+        text = prepend_legend(text)
+
+
+    chars = parse_csv(args.font_csv)
+    text = normalize_text(text, chars, extreme=args.extreme, transliterate=args.transliterate)
+
+    max_rows, max_cols, space_width = get_grid_metrics(args.size)
+    width_px, height_px, margin_px = get_page_metrics(args.dpi, args.margin_mm, args.page_mm)
+
+    layout = functools.partial(layout_pages, text, chars, max_rows, max_cols, space_width, width_px, height_px, margin_px,
+                               scale=args.scale, line_gap=args.line_gap, compact=args.compact)
+
+    first_page = 1
+    page_count = None
+    if args.pages:
+        if args.page_index is None:
+            args.page_index = args.text + ".pageindex.json"
+        key = page_index_key(text, args.font_csv, [args.size, args.scale, width_px, height_px, margin_px, args.line_gap, args.compact])
+        page_starts = load_page_index(args.page_index, key)
+        if page_starts is None:
+            page_starts = build_page_index(args.page_index, key, layout)
+        first_page, last_page = args.pages
+        page_count = len(page_starts)
+        if last_page > page_count:
+            print(f"Error: the document has {page_count} pages, cannot render pages {first_page}-{last_page}")
+            sys.exit(1)
+        pages = itertools.islice(layout(start=page_starts[first_page - 1], by_line=bool(args.tiles)), last_page - first_page + 1)
     else:
-        for i, im in enumerate(images):
-            out_name = f"{base}_{i+1}{ext}"
-            im.save(out_name)
-            print(f"Saved to {out_name} (Size: {width_px}x{height_px}, DPI: {args.dpi})")
+        pages = layout(by_line=bool(args.tiles))
+
+    if args.vector:
+        import vector_output
+        vector_output.save_vector(args.vector, pages, args.out, width_px, height_px, margin_px,
+                                  max_rows, max_cols, args.scale, args.dpi, first_page=first_page, page_count=page_count)
+        return
+
+    if args.toolpath:
+        import toolpath_output
+        toolpath_output.save_toolpath(args.toolpath, pages, args.out, width_px, height_px, margin_px, max_rows, max_cols,
+                                      args.scale, args.dpi, order=args.toolpath_order, engrave_feed=args.engrave_feed,
+                                      travel_feed=args.travel_feed, accel=args.accel, power=args.power,
+                                      plunge_mm=args.plunge_depth_mm, safe_z_mm=args.safe_z_mm,
+                                      first_page=first_page, page_count=page_count)
+        return
+
+    if args.tiles:
+        import tiled_output
+        tiled_output.save_tiled(args.tiles, pages, args.out, width_px, height_px, max_rows, max_cols, args.scale, args.dpi,
+                                args.tile_px, first_page=first_page, page_count=page_count)
+        return
+
+    images = (rasterize_page(page, width_px, height_px, max_rows, max_cols, args.scale) for page in pages)
+    save_images(images, args.out, f"(Size: {width_px}x{height_px}, DPI: {args.dpi})",
+                encode_threads=args.encode_threads, queue_depth=args.encode_queue, compress_level=args.compress_level,
+                first_page=first_page, page_count=page_count)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,118 @@
+import argparse
+import hashlib
+import os
+import shutil
+import sys
+
+from fontTools import subset
+
+from render_text import default_font_csv, normalize_text, parse_csv, prepend_legend
+
+SUBSET_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".subset_cache")
+
+FLAVOR_EXTENSIONS = {"ttf": ".ttf", "woff": ".woff", "woff2": ".woff2"}
+
+
+def default_font_path(size):
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return os.path.join(base_dir, "ttf_fonts", f"Times_Sitelew_Roman_{size}_pixels.ttf")
+
+
+def collect_codepoints(texts, chars, extreme=False, transliterate=True, include_legend=True):
+    # Run the same normalization as render_text.py, so the subset holds exactly
+    # the glyphs a rendered document can reference.
+    if include_legend:
+        texts = [prepend_legend("")] + list(texts)
+    codepoints = {ord(' ')}
+    for text in texts:
+        text = normalize_text(text, chars, extreme=extreme, transliterate=transliterate)
+        codepoints.update(ord(c) for c in text if c != '\n')
+    return codepoints
+
+
+def subset_cache_key(font_path, codepoints, flavor):
+    # The source font digest is part of the key, so rebuilding a font with
+    # build_font.py never serves a stale subset.
+    digest = hashlib.sha256()
+    with open(font_path, 'rb') as f:
+        digest.update(hashlib.sha256(f.read()).digest())
+    digest.update(flavor.encode("ascii"))
+    digest.update(",".join(f"{cp:X}" for cp in sorted(codepoints)).encode("ascii"))
+    return digest.hexdigest()[:16]
+
+
+def build_subset(font_path, codepoints, flavor, out_path):
+    options = subset.Options()
+    options.flavor = None if flavor == "ttf" else flavor
+    # Keep the embedded bitmap strikes, which the subsetter drops by default
+    options.drop_tables = [t for t in options.drop_tables if t not in ("EBDT", "EBLC")]
+    options.notdef_outline = True
+    options.name_IDs = ["*"]
+    options.name_languages = ["*"]
+    options.layout_features = []
+
+    font = subset.load_font(font_path, options)
+    subsetter = subset.Subsetter(options)
+    subsetter.populate(unicodes=codepoints)
+    subsetter.subset(font)
+    tmp_path = out_path + ".tmp"
+    subset.save_font(font, tmp_path, options)
+    os.replace(tmp_path, out_path)
+
+
+def get_subset(font_path, codepoints, flavor="woff2", cache_dir=SUBSET_CACHE_DIR):
+    key = subset_cache_key(font_path, codepoints, flavor)
+    name = os.path.splitext(os.path.basename(font_path))[0]
+    cached_path = os.path.join(cache_dir, f"{name}-{key}{FLAVOR_EXTENSIONS[flavor]}")
+    if os.path.exists(cached_path):
+        return cached_path, True
+    os.makedirs(cache_dir, exist_ok=True)
+    build_subset(font_path, codepoints, flavor, cached_path)
+    return cached_path, False
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build a subset of a Sitelew font holding only the glyphs a text or corpus uses.")
+    parser.add_argument("--text", required=True, nargs="+", help="Input text file(s); the subset covers the union of their characters")
+    parser.add_argument("--size", choices=["4x3", "5x4", "5x5"], default="5x5", help="Font grid size to subset")
+    parser.add_argument("--font", default=None, help="Source TTF, defaults to the size-appropriate font in the ttf_fonts directory if unspecified.")
+    parser.add_argument("--font-csv", default=None, help="Font CSV file used for normalization, defaults to the size-appropriate CSV in docs/definitions directory if unspecified.")
+    parser.add_argument("--flavor", choices=sorted(FLAVOR_EXTENSIONS), default="woff2", help="Output format: woff2 for the web, ttf for PDF embedding (default: woff2)")
+    parser.add_argument("--out", default=None, help="Also copy the subset font to this path")
+    parser.add_argument("--cache-dir", default=SUBSET_CACHE_DIR, help="Directory of subsets cached by codepoint-set hash")
+    parser.add_argument("--extreme", action="store_true", help="Normalize as render_text.py --extreme does (lowercase, subscript digits)")
+    parser.add_argument("--no-legend", action="store_false", dest="include_legend", help="Do not include the characters of character_legend.txt")
+    parser.add_argument("--no-transliterate", action="store_false", dest="transliterate", help="Disable transliteration of unsupported characters")
+    args = parser.parse_args()
+
+    if args.font is None:
+        args.font = default_font_path(args.size)
+    if args.font_csv is None:
+        args.font_csv = default_font_csv(args.size)
+
+    texts = []
+    for path in args.text:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                texts.append(f.read())
+        except Exception as e:
+            print(f"Error reading {path}: {e}")
+            sys.exit(1)
+
+    chars = parse_csv(args.font_csv)
+    codepoints = collect_codepoints(texts, chars, extreme=args.extreme, transliterate=args.transliterate, include_legend=args.include_legend)
+
+    try:
+        subset_path, cached = get_subset(args.font, codepoints, args.flavor, args.cache_dir)
+    except ImportError as e:
+        print(f"Error: {args.flavor} output requires an extra module ({e}); for woff2 run: pip install brotli")
+        sys.exit(1)
+
+    print(f"{'Reused cached' if cached else 'Built'} subset {subset_path} ({len(codepoints)} codepoints, {os.path.getsize(subset_path)} bytes, source {os.path.getsize(args.font)} bytes)")
+    if args.out:
+        shutil.copyfile(subset_path, args.out)
+        print(f"Saved to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+import os
+import struct
+import zlib
+
+from PIL import Image, ImageDraw
+
+from render_text import draw_char
+
+# Canvases far beyond A4 (an A0 plate at 1200 DPI is over two billion pixels)
+# are rasterized one row of square tiles at a time. The layout streams in line
+# by line (render_text.layout_pages with by_line) and every line is drawn into
+# the tiles it touches as it arrives, so memory holds one row of tiles and a
+# line or two of glyph placements, whatever the canvas size or amount of text.
+
+TIFF_SHORT = 3
+TIFF_LONG = 4
+TIFF_RATIONAL = 5
+TIFF_LONG8 = 16
+TIFF_TYPE_FORMATS = {TIFF_SHORT: "H", TIFF_LONG: "I", TIFF_RATIONAL: "II", TIFF_LONG8: "Q"}
+
+
+def tile_rows(lines, width_px, height_px, max_rows, max_cols, scale, tile_px):
+    # Yields every row of tiles as (ty, tiles), full-size mode "1" images, or
+    # None for a tile no glyph touches. A row is done once the layout yields a
+    # line that starts below it; y never decreases from one line to the next.
+    # Glyphs that hang over into the next row, and the line read past the row,
+    # are kept and drawn again there.
+    glyph_w = max_cols * scale
+    glyph_h = max_rows * scale
+    cols = (width_px + tile_px - 1) // tile_px
+    lines = iter(lines)
+    pending = []
+    for ty in range(0, height_px, tile_px):
+        row_end = ty + tile_px
+        tiles = [None] * cols
+        draws = [None] * cols
+
+        def draw(placements):
+            for x, y, grid in placements:
+                if y < row_end and y + glyph_h > ty:
+                    for col in range(max(x, 0) // tile_px, min((x + glyph_w - 1) // tile_px, cols - 1) + 1):
+                        if draws[col] is None:
+                            tiles[col] = Image.new("1", (tile_px, tile_px), color=1)
+                            draws[col] = ImageDraw.Draw(tiles[col])
+                        draw_char(draws[col], grid, x - col * tile_px, y - ty, max_rows, max_cols, scale)
+
+        draw(pending)
+        pending = [placement for placement in pending if placement[1] + glyph_h > row_end]
+        if not pending or pending[-1][1] < row_end:
+            for line in lines:
+                draw(line)
+                pending.extend(placement for placement in line if placement[1] + glyph_h > row_end)
+                if line[0][1] >= row_end:
+                    break
+        yield ty, tiles
+
+
+def tiff_ifd(entries, offset, big):
+    # Packs an image file directory that starts at the given file offset.
+    # Values too large for an entry follow the directory.
+    prefix = "<Q" if big else "<H"
+    entry_format = "<HHQ" if big else "<HHI"
+    entry_size = 20 if big else 12
+    value_size = 8 if big else 4
+    next_ifd = b"\0" * value_size
+    data_offset = offset + struct.calcsize(prefix) + len(entries) * entry_size + len(next_ifd)
+    ifd = [struct.pack(prefix, len(entries))]
+    extra = []
+    for tag, tiff_type, values in sorted(entries):
+        packed = struct.pack("<" + TIFF_TYPE_FORMATS[tiff_type] * len(values), *[v for value in values for v in (value if isinstance(value, tuple) else (value,))])
+        count = len(values)
+        if len(packed) <= value_size:
+            ifd.append(struct.pack(entry_format, tag, tiff_type, count) + packed.ljust(value_size, b"\0"))
+        else:
+            ifd.append(struct.pack(entry_format, tag, tiff_type, count) + struct.pack("<Q" if big else "<I", data_offset))
+            extra.append(packed)
+            data_offset += len(packed)
+    return b"".join(ifd) + next_ifd + b"".join(extra)
+
+
+def save_tiff(lines, out_name, width_px, height_px, max_rows, max_cols, scale, dpi, tile_px):
+    # A bilevel, Deflate-compressed tiled TIFF written as a stream: a header,
+    # the tiles in row-major order, then the directory, whose offset is
+    # patched into the header. BigTIFF is used whenever the file could
+    # outgrow the 4 GiB reach of classic TIFF offsets.
+    cols = (width_px + tile_px - 1) // tile_px
+    rows = (height_px + tile_px - 1) // tile_px
+    tile_bytes = (tile_px + 7) // 8 * tile_px
+    big = rows * cols * (tile_bytes + tile_bytes // 1000 + 64) > 0xFFFFFFFF - (1 << 20)
+    offsets = []
+    byte_counts = []
+    blank = zlib.compress(Image.new("1", (tile_px, tile_px), color=1).tobytes())
+    with open(out_name, "wb") as f:
+        f.write(b"II+\0\x08\0\0\0" + b"\0" * 8 if big else b"II*\0" + b"\0" * 4)
+        for ty, tiles in tile_rows(lines, width_px, height_px, max_rows, max_cols, scale, tile_px):
+            for tile in tiles:
+                # Edge tiles keep the full tile size; the part past the canvas stays white
+                data = blank if tile is None else zlib.compress(tile.tobytes())
+                offsets.append(f.tell())
+                byte_counts.append(len(data))
+                f.write(data)
+        if f.tell() % 2:
+            f.write(b"\0")
+        ifd_offset = f.tell()
+        offset_type = TIFF_LONG8 if big else TIFF_LONG
+        entries = [
+            (256, TIFF_LONG, [width_px]),
+            (257, TIFF_LONG, [height_px]),
+            (258, TIFF_SHORT, [1]),          # BitsPerSample
+            (259, TIFF_SHORT, [8]),          # Compression: Deflate
+            (262, TIFF_SHORT, [1]),          # PhotometricInterpretation: BlackIsZero, as Pillow's mode "1"
+            (277, TIFF_SHORT, [1]),          # SamplesPerPixel
+            (282, TIFF_RATIONAL, [(dpi, 1)]),
+            (283, TIFF_RATIONAL, [(dpi, 1)]),
+            (284, TIFF_SHORT, [1]),          # PlanarConfiguration
+            (296, TIFF_SHORT, [2]),          # ResolutionUnit: inch
+            (322, TIFF_LONG, [tile_px]),
+            (323, TIFF_LONG, [tile_px]),
+            (324, offset_type, offsets),
+            (325, offset_type, byte_counts),
+        ]
+        f.write(tiff_ifd(entries, ifd_offset, big))
+        f.seek(8 if big else 4)
+        f.write(struct.pack("<Q" if big else "<I", ifd_offset))
+    return rows * cols
+
+
+def save_tile_files(lines, base, ext, width_px, height_px, max_rows, max_cols, scale, tile_px):
+    # One image per tile, named by tile row and column; edge tiles are cropped
+    # to the canvas. Returns the file names.
+    names = []
+    for ty, tiles in tile_rows(lines, width_px, height_px, max_rows, max_cols, scale, tile_px):
+        for col, tile in enumerate(tiles):
+            tx = col * tile_px
+            if tile is None:
+                tile = Image.new("1", (tile_px, tile_px), color=1)
+            if tx + tile_px > width_px or ty + tile_px > height_px:
+                tile = tile.crop((0, 0, min(tile_px, width_px - tx), min(tile_px, height_px - ty)))
+            names.append(f"{base}_r{ty // tile_px + 1}_c{col + 1}{ext}")
+            tile.save(names[-1])
+    return names
+
+
+def save_tiled(fmt, pages, out, width_px, height_px, max_rows, max_cols, scale, dpi, tile_px, first_page=1, page_count=None):
+    # As in render_text.save_images, a lone page keeps the plain output name.
+    # Pages stream through here, so without a page count the first page is
+    # written under the plain name and renamed if a second page follows.
+    base = os.path.splitext(out)[0]
+    first = None # (names, shown name, details) of a first page that may be the only one
+    for number, page in enumerate(pages, start=first_page):
+        if first is not None:
+            names, shown, details = first
+            first = None
+            numbered = f"{base}_{first_page}"
+            for name in names:
+                os.replace(name, numbered + name[len(base):])
+            print(f"Saved to {numbered + shown[len(base):]} {details}")
+        lone = page_count == 1 if page_count is not None else number == first_page
+        page_base = base if lone else f"{base}_{number}"
+        if fmt == "tiff":
+            shown = page_base + ".tif"
+            names = [shown]
+            tiles = save_tiff(page, shown, width_px, height_px, max_rows, max_cols, scale, dpi, tile_px)
+        else:
+            shown = f"{page_base}_r*_c*.{fmt}"
+            names = save_tile_files(page, page_base, "." + fmt, width_px, height_px, max_rows, max_cols, scale, tile_px)
+            tiles = len(names)
+        details = f"(Size: {width_px}x{height_px}, DPI: {dpi}, {tiles} tiles of {tile_px}x{tile_px})"
+        if page_count is None and number == first_page:
+            first = (names, shown, details)
+        else:
+            print(f"Saved to {shown} {details}")
+    if first is not None:
+        print(f"Saved to {first[1]} {first[2]}")
@@ -0,0 +1,326 @@
+import heapq
+import math
+import os
+
+from vector_output import page_lit_cells
+
+# Engraving toolpaths are built on the same lattice as the vector backend, with
+# a tool (beam or bit) one cell wide. The tool centre runs from the centre of
+# the first cell of a stroke to the centre of its last cell, so the cut covers
+# exactly the lit cells. Strokes stay in lattice units as (x0, y0, x1, y1), from
+# where the tool starts to where it stops, until they are written out in mm. A
+# stroke over a single cell starts and stops at the same point: a dot.
+
+TWO_OPT_WINDOW = 16
+TWO_OPT_PASSES = 2
+NEAREST_BUCKET = 8 # lattice cells per side of a spatial hash bucket
+NEAREST_MAX_RING = 64
+
+
+def cell_runs(cells, axis):
+    # Maximal runs of consecutive lit cells along one axis (0: rows,
+    # 1: columns), as (fixed coordinate, first, last)
+    lines = {}
+    for cell in cells:
+        lines.setdefault(cell[1 - axis], []).append(cell[axis])
+    runs = []
+    for fixed, coords in lines.items():
+        coords.sort()
+        start = prev = coords[0]
+        for c in coords[1:]:
+            if c != prev + 1:
+                runs.append((fixed, start, prev))
+                start = c
+            prev = c
+        runs.append((fixed, start, prev))
+    return runs
+
+
+def cell_strokes(cells):
+    # Covers every lit cell exactly once with horizontal and vertical strokes,
+    # greedily taking the longest remaining run in either direction, so a
+    # vertical stem is one stroke rather than a stack of dots. Runs that lost
+    # cells to an earlier stroke go back into the heap as their free pieces.
+    # Ties go to vertical runs, which keeps the stems of letters like H whole.
+    # Returns strokes sorted by their starting row, then column.
+    heap = [(-(last - first + 1), 1 - axis, fixed, first, axis)
+            for axis in (0, 1) for fixed, first, last in cell_runs(cells, axis)]
+    heapq.heapify(heap)
+    free = set(cells)
+    strokes = []
+    while heap:
+        neg_length, _, fixed, first, axis = heapq.heappop(heap)
+        last = first - neg_length - 1
+        run = [(c, fixed) if axis == 0 else (fixed, c) for c in range(first, last + 1)]
+        if all(cell in free for cell in run):
+            free.difference_update(run)
+            (x0, y0), (x1, y1) = run[0], run[-1]
+            strokes.append((x0 + 0.5, y0 + 0.5, x1 + 0.5, y1 + 0.5))
+            continue
+        start = None
+        for c, cell in enumerate(run + [None], start=first):
+            if cell in free:
+                if start is None:
+                    start = c
+            elif start is not None:
+                heapq.heappush(heap, (-(c - start), 1 - axis, fixed, start, axis))
+                start = None
+    strokes.sort(key=lambda stroke: (stroke[1], stroke[0]))
+    return strokes
+
+
+def boustrophedon_order(strokes):
+    # Row by row, alternating direction, so the head never returns across
+    # the page between two rows. Expects strokes sorted by their starting
+    # row, as cell_strokes returns them; vertical strokes belong to the row
+    # they start in.
+    route = []
+    forward = True
+    row = []
+    for k, stroke in enumerate(strokes):
+        row.append(stroke)
+        if k + 1 == len(strokes) or strokes[k + 1][1] != stroke[1]:
+            if not forward:
+                row = [(x1, y1, x0, y0) for x0, y0, x1, y1 in reversed(row)]
+            route.extend(row)
+            row = []
+            forward = not forward
+    return route
+
+
+def nearest_order(strokes, start=(0, 0)):
+    # Greedy nearest neighbour over both ends of every stroke, using a spatial
+    # hash so each step only looks at the buckets around the head. Strokes
+    # leave their buckets once they are routed.
+    size = NEAREST_BUCKET
+    buckets = {}
+    keys = []
+    for k, (x0, y0, x1, y1) in enumerate(strokes):
+        stroke_keys = {(int(x0 // size), int(y0 // size)), (int(x1 // size), int(y1 // size))}
+        for key in stroke_keys:
+            buckets.setdefault(key, []).append(k)
+        keys.append(stroke_keys)
+    route = []
+    hx, hy = start
+    for _ in range(len(strokes)):
+        bx, by = int(hx // size), int(hy // size)
+        best = best_k = None
+        best_d = math.inf
+        radius = 0
+        # Buckets in ring r are at least (r - 1) * size away from the head
+        while best is None or best_d > (radius - 1) * size:
+            if radius > NEAREST_MAX_RING:
+                ring = list(buckets) # far from everything left; scan what remains
+            elif radius == 0:
+                ring = [(bx, by)]
+            else:
+                ring = [(bx + d, by + e) for d in range(-radius, radius + 1) for e in (-radius, radius)]
+                ring += [(bx + d, by + e) for d in (-radius, radius) for e in range(-radius + 1, radius)]
+            for key in ring:
+                for k in buckets.get(key, ()):
+                    x0, y0, x1, y1 = strokes[k]
+                    d = math.hypot(x0 - hx, y0 - hy)
+                    if d < best_d:
+                        best, best_k, best_d = (x0, y0, x1, y1), k, d
+                    d = math.hypot(x1 - hx, y1 - hy)
+                    if d < best_d:
+                        best, best_k, best_d = (x1, y1, x0, y0), k, d
+            if radius > NEAREST_MAX_RING:
+                break
+            radius += 1
+        for key in keys[best_k]:
+            bucket = buckets[key]
+            bucket.remove(best_k)
+            if not bucket:
+                del buckets[key]
+        route.append(best)
+        hx, hy = best[2], best[3]
+    return route
+
+
+def two_opt(route, start=(0, 0), window=TWO_OPT_WINDOW, passes=TWO_OPT_PASSES):
+    # Windowed 2-opt on an open path: reversing route[i..j] also reverses the
+    # direction of every stroke in it, so only the two travel moves at its
+    # ends change length. gaps[k] is the travel move after route[k].
+    dist = math.dist
+    n = len(route)
+    gaps = [dist(route[k][2:], route[k + 1][:2]) for k in range(n - 1)] + [0.0]
+    for _ in range(passes):
+        improved = False
+        for i in range(n):
+            prev_end = route[i - 1][2:] if i else start
+            start_i = route[i][:2]
+            gap_before = dist(prev_end, start_i)
+            for j in range(i + 1, min(n, i + window)):
+                end_j = route[j][2:]
+                delta = dist(prev_end, end_j) - gap_before
+                if j + 1 < n:
+                    delta += dist(start_i, route[j + 1][:2]) - gaps[j]
+                if delta < -1e-9:
+                    route[i:j + 1] = [(x1, y1, x0, y0) for x0, y0, x1, y1 in reversed(route[i:j + 1])]
+                    gaps[i:j] = gaps[j - 1:i - 1 if i else None:-1]
+                    if i:
+                        gaps[i - 1] = dist(prev_end, route[i][:2])
+                    if j + 1 < n:
+                        gaps[j] = dist(route[j][2:], route[j + 1][:2])
+                    start_i = route[i][:2]
+                    gap_before = dist(prev_end, start_i)
+                    improved = True
+        if not improved:
+            break
+    return route
+
+
+def move_time(distance, feed, accel):
+    # Seconds for a move that starts and ends at rest, with a trapezoidal
+    # (or, for short moves, triangular) speed profile
+    if distance <= 0:
+        return 0.0
+    speed = feed / 60
+    if distance >= speed * speed / accel:
+        return distance / speed + speed / accel
+    return 2 * math.sqrt(distance / accel)
+
+
+def dot_dwell(cell_mm, engrave_feed):
+    # A laser dot dwells as long as a stroke takes to cross one cell, so dots
+    # and strokes get the same dose
+    return cell_mm / (engrave_feed / 60)
+
+
+def route_stats(route, cell_mm, engrave_feed, travel_feed, accel, plunge_mm=None, safe_z_mm=1.0, start=(0, 0)):
+    engrave_mm = travel_mm = seconds = 0.0
+    hx, hy = start
+    for x0, y0, x1, y1 in route:
+        travel = math.hypot(x0 - hx, y0 - hy) * cell_mm
+        engrave = math.hypot(x1 - x0, y1 - y0) * cell_mm
+        travel_mm += travel
+        engrave_mm += engrave
+        seconds += move_time(travel, travel_feed, accel) + move_time(engrave, engrave_feed, accel)
+        if plunge_mm is not None:
+            seconds += move_time(safe_z_mm + plunge_mm, engrave_feed, accel) + move_time(safe_z_mm + plunge_mm, travel_feed, accel)
+        elif not engrave:
+            seconds += dot_dwell(cell_mm, engrave_feed)
+        hx, hy = x1, y1
+    # back to the start
+    travel = math.hypot(start[0] - hx, start[1] - hy) * cell_mm
+    travel_mm += travel
+    seconds += move_time(travel, travel_feed, accel)
+    return engrave_mm, travel_mm, seconds
+
+
+def format_duration(seconds):
+    minutes, seconds = divmod(round(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h {minutes:02d}m {seconds:02d}s" if hours else f"{minutes}m {seconds:02d}s"
+
+
+def gcode_page(route, to_mm, stats, engrave_feed, power, dwell_s, plunge_mm=None, safe_z_mm=1.0):
+    engrave_mm, travel_mm, seconds = stats
+    lines = [
+        f"; {len(route)} strokes, engrave {engrave_mm:.1f} mm, travel {travel_mm:.1f} mm, estimated {format_duration(seconds)}",
+        "G21 ; mm",
+        "G90 ; absolute coordinates",
+    ]
+    if plunge_mm is None:
+        # Laser: in M4 mode the beam is off during G0 moves and on during G1
+        lines.append(f"M4 S{power}")
+    else:
+        lines.append(f"G0 Z{safe_z_mm:.3f}")
+        lines.append(f"M3 S{power}")
+    feed = f" F{engrave_feed:g}"
+    for x0, y0, x1, y1 in route:
+        (mx0, my0), (mx1, my1) = to_mm(x0, y0), to_mm(x1, y1)
+        lines.append(f"G0 X{mx0:.3f} Y{my0:.3f}")
+        if plunge_mm is not None:
+            lines.append(f"G1 Z{-plunge_mm:.3f}{feed}")
+            feed = ""
+        if (x0, y0) != (x1, y1):
+            lines.append(f"G1 X{mx1:.3f} Y{my1:.3f}{feed}")
+            feed = ""
+        elif plunge_mm is None:
+            # A dot: M4 scales the power with the speed, so the beam would
+            # stay off at rest. Fire it at constant power for the dwell.
+            lines += ["M3", f"G1 X{mx1:.3f} Y{my1:.3f}{feed}", f"G4 P{dwell_s:.4f}", "M4"]
+            feed = ""
+        if plunge_mm is not None:
+            lines.append(f"G0 Z{safe_z_mm:.3f}")
+    lines += ["M5", "G0 X0 Y0", "M2"]
+    return "\n".join(lines) + "\n"
+
+
+def svg_toolpath_page(route, to_mm, width_mm, height_mm, cell_mm, start=(0, 0)):
+    # Engraved strokes in black as the tool cuts them, one cell wide with round
+    # ends, over the travel moves as thin red lines. Dots are filled circles
+    # of the tool diameter, since not every renderer draws the round cap of a
+    # zero-length line.
+    strokes = []
+    dots = []
+    travel = []
+    r = cell_mm / 2
+    hx, hy = to_mm(*start)
+    for x0, y0, x1, y1 in route:
+        (mx0, my0), (mx1, my1) = to_mm(x0, y0), to_mm(x1, y1)
+        travel.append(f"M{hx:.3f} {hy:.3f}L{mx0:.3f} {my0:.3f}")
+        if (x0, y0) != (x1, y1):
+            strokes.append(f"M{mx0:.3f} {my0:.3f}L{mx1:.3f} {my1:.3f}")
+        else:
+            dots.append(f"M{mx0 - r:.3f} {my0:.3f}a{r:.4f} {r:.4f} 0 1 0 {cell_mm:.4f} 0a{r:.4f} {r:.4f} 0 1 0 {-cell_mm:.4f} 0")
+        hx, hy = mx1, my1
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width_mm:.3f}mm" height="{height_mm:.3f}mm" '
+        f'viewBox="0 0 {width_mm:.3f} {height_mm:.3f}">'
+        f'<rect width="{width_mm:.3f}" height="{height_mm:.3f}" fill="#fff"/>'
+        f'<path fill="none" stroke="#f00" stroke-width="{cell_mm / 5:.4f}" d="{"".join(travel)}"/>'
+        f'<path fill="none" stroke="#000" stroke-width="{cell_mm:.4f}" stroke-linecap="round" d="{"".join(strokes)}"/>'
+        f'<path fill="#000" d="{"".join(dots)}"/>'
+        '</svg>\n'
+    )
+
+
+def save_toolpath(fmt, pages, out, width_px, height_px, margin_px, max_rows, max_cols, scale, dpi,
+                  order="nearest", engrave_feed=1000, travel_feed=3000, accel=1000, power=1000,
+                  plunge_mm=None, safe_z_mm=1.0, first_page=1, page_count=None):
+    base = os.path.splitext(out)[0]
+    ext = ".gcode" if fmt == "gcode" else ".svg"
+    px_mm = 25.4 / dpi
+    cell_mm = scale * px_mm
+    width_mm = width_px * px_mm
+    height_mm = height_px * px_mm
+    # The lattice origin is at the top-left margin. G-code uses machine
+    # coordinates with Y pointing up from the bottom-left corner of the page.
+    if fmt == "gcode":
+        def to_mm(x, y):
+            return margin_px * px_mm + x * cell_mm, height_mm - margin_px * px_mm - y * cell_mm
+    else:
+        def to_mm(x, y):
+            return margin_px * px_mm + x * cell_mm, margin_px * px_mm + y * cell_mm
+    # The head starts and ends every page at the machine origin, the
+    # bottom-left corner of the page
+    start = (-margin_px / scale, (height_px - margin_px) / scale)
+
+    pages_routes = []
+    for page in pages:
+        strokes = cell_strokes(page_lit_cells(page, width_px, height_px, margin_px, max_rows, max_cols, scale))
+        if order == "boustrophedon":
+            route = boustrophedon_order(strokes)
+        else:
+            route = two_opt(nearest_order(strokes, start), start)
+        pages_routes.append(route)
+    if page_count is None:
+        page_count = len(pages_routes)
+
+    total_seconds = 0.0
+    for i, route in enumerate(pages_routes):
+        out_name = base + ext if page_count == 1 else f"{base}_{i+first_page}{ext}"
+        stats = route_stats(route, cell_mm, engrave_feed, travel_feed, accel, plunge_mm, safe_z_mm, start)
+        total_seconds += stats[2]
+        with open(out_name, "w", encoding="ascii") as f:
+            if fmt == "gcode":
+                f.write(gcode_page(route, to_mm, stats, engrave_feed, power, dot_dwell(cell_mm, engrave_feed), plunge_mm, safe_z_mm))
+            else:
+                f.write(svg_toolpath_page(route, to_mm, width_mm, height_mm, cell_mm, start))
+        print(f"Saved to {out_name} ({len(route)} strokes, engrave {stats[0] / 1000:.2f} m, "
+              f"travel {stats[1] / 1000:.2f} m, estimated {format_duration(stats[2])})")
+    if len(pages_routes) > 1:
+        print(f"Estimated machine time for {len(pages_routes)} pages: {format_duration(total_seconds)}")
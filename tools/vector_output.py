@@ -0,0 +1,342 @@
+import collections
+import gzip
+import os
+import zlib
+
+# Every glyph origin produced by render_text.layout_pages lies on the lattice
+# (margin_px + i * scale, margin_px + j * scale), so a page can be described as a
+# set of lit lattice cells (i, j) and drawn with a single scaling transform.
+
+
+def get_lit_cells(grid, max_rows, max_cols):
+    cells = []
+    for r_idx, row in enumerate(grid):
+        if r_idx >= max_rows:
+            break
+        for c_idx, cell in enumerate(row):
+            if c_idx >= max_cols:
+                break
+            if "#" in cell:
+                cells.append((c_idx, r_idx))
+    return cells
+
+
+def page_lit_cells(page, width_px, height_px, margin_px, max_rows, max_cols, scale):
+    # Cells that start outside the page are dropped; the raster backend clips
+    # them too. Cells straddling the edge are clipped by the page box.
+    max_i = (width_px - margin_px + scale - 1) // scale
+    max_j = (height_px - margin_px + scale - 1) // scale
+    glyph_cells = {} # keyed by id(grid): grids are shared objects from parse_csv
+    lit = set()
+    for x, y, grid in page:
+        cells = glyph_cells.get(id(grid))
+        if cells is None:
+            cells = get_lit_cells(grid, max_rows, max_cols)
+            glyph_cells[id(grid)] = cells
+        i0 = (x - margin_px) // scale
+        j0 = (y - margin_px) // scale
+        for c, r in cells:
+            i = i0 + c
+            j = j0 + r
+            if i < max_i and j < max_j:
+                lit.add((i, j))
+    return lit
+
+
+def merge_rectangles(cells):
+    # Merge each row into horizontal runs, then stack runs with identical
+    # extents in consecutive rows into taller rectangles. Runs freely cross
+    # glyph boundaries. Returns (i, j, width, height) tuples.
+    rows = {}
+    for i, j in cells:
+        rows.setdefault(j, []).append(i)
+
+    rects = []
+    open_rects = {} # (i_start, i_end) -> [i, j, width, height] ending at the previous row
+    prev_j = None
+    for j in sorted(rows):
+        if prev_j is None or j != prev_j + 1:
+            rects.extend(open_rects.values())
+            open_rects = {}
+        next_open = {}
+        cols = sorted(rows[j])
+        start = cols[0]
+        for k in range(1, len(cols) + 1):
+            if k < len(cols) and cols[k] == cols[k - 1] + 1:
+                continue
+            run = (start, cols[k - 1])
+            rect = open_rects.pop(run, None)
+            if rect is None:
+                rect = [start, j, run[1] - start + 1, 0]
+            rect[3] += 1
+            next_open[run] = rect
+            if k < len(cols):
+                start = cols[k]
+        rects.extend(open_rects.values())
+        open_rects = next_open
+        prev_j = j
+    rects.extend(open_rects.values())
+    return sorted(rects, key=lambda rect: (rect[1], rect[0]))
+
+
+# Defining a glyph once costs about as much as drawing it directly this many
+# times; rarer glyphs, such as most of the character legend, are drawn directly
+PDF_MIN_USES = 8
+SVG_MIN_USES = 3
+
+
+def page_glyphs(page, glyphs, glyph_ids, margin_px, max_rows, max_cols, scale):
+    # The page's placements as lattice positions (i, j, index), where index
+    # points into glyphs, the merged rectangles of every distinct glyph seen so
+    # far (shared across pages, and extended here). Blank glyphs are dropped.
+    # Glyphs are drawn whole; the parts past the page edge are clipped by the
+    # page box.
+    placed = []
+    for x, y, grid in page:
+        index = glyph_ids.get(id(grid)) # keyed by id(grid) as in page_lit_cells
+        if index is None:
+            rects = merge_rectangles(get_lit_cells(grid, max_rows, max_cols))
+            index = len(glyphs) if rects else -1
+            if rects:
+                glyphs.append(rects)
+            glyph_ids[id(grid)] = index
+        if index >= 0:
+            placed.append(((x - margin_px) // scale, (y - margin_px) // scale, index))
+    return placed
+
+
+def split_shared(pages_placed, glyphs, min_uses):
+    # Splits every page into the placements of glyphs used at least min_uses
+    # times across pages_placed, which are defined once and referenced, and
+    # the merged rectangles of all other glyphs, which cost less to draw
+    # directly than to define. Returns (shared, rects) per page.
+    uses = collections.Counter(index for placed in pages_placed for _, _, index in placed)
+    split = []
+    for placed in pages_placed:
+        shared = []
+        cells = set()
+        for i, j, index in placed:
+            if uses[index] >= min_uses:
+                shared.append((i, j, index))
+                continue
+            for ri, rj, w, h in glyphs[index]:
+                for c in range(ri, ri + w):
+                    for r in range(rj, rj + h):
+                        cells.add((i + c, j + r))
+        split.append((shared, merge_rectangles(cells)))
+    return split
+
+
+def rect_path(rects):
+    # Relative moves: "z" returns to the start of the previous rectangle, and
+    # rectangles are sorted by row, so the offsets stay short.
+    path = []
+    prev_i = prev_j = 0
+    for i, j, w, h in rects:
+        path.append(f"m{i - prev_i} {j - prev_j}h{w}v{h}h-{w}z")
+        prev_i, prev_j = i, j
+    return "".join(path)
+
+
+def svg_uses(placed, glyphs):
+    # Glyphs used at least SVG_MIN_USES times on the page are defined once and
+    # drawn with <use>, one group per line; the other rectangles make up one
+    # path.
+    shared, rects = split_shared([placed], glyphs, SVG_MIN_USES)[0]
+    body = ["<defs>"]
+    body.extend(f'<path id="g{index}" d="{rect_path(glyphs[index])}"/>'
+                for index in sorted({index for _, _, index in shared}))
+    body.append("</defs>")
+    if rects:
+        body.append(f'<path d="{rect_path(rects)}"/>')
+    prev_j = None
+    for i, j, index in shared:
+        if j != prev_j:
+            if prev_j is not None:
+                body.append("</g>")
+            body.append(f'<g transform="translate(0 {j})">')
+            prev_j = j
+        body.append(f'<use href="#g{index}" x="{i}"/>')
+    if prev_j is not None:
+        body.append("</g>")
+    return "".join(body)
+
+
+def svg_glyph_path(placed, glyphs):
+    # One path made of every glyph's own relative outline, for gzipped output:
+    # each occurrence of a glyph is the same string, which deflate stores once.
+    # This compresses much better than <use> elements, whose absolute
+    # positions deflate cannot shorten.
+    outlines = {}
+    path = []
+    prev_i = prev_j = 0
+    for i, j, index in placed:
+        outline = outlines.get(index)
+        if outline is None:
+            rects = glyphs[index]
+            # "z" leaves the pen at the start of the glyph's last rectangle
+            outline = outlines[index] = (rect_path(rects), rects[-1][0], rects[-1][1])
+        path.append(f"m{i - prev_i} {j - prev_j}{outline[0]}")
+        prev_i, prev_j = i + outline[1], j + outline[2]
+    return f'<path d="{"".join(path)}"/>' if path else ""
+
+
+def svg_page(body, width_px, height_px, margin_px, scale, dpi):
+    # body is drawn in lattice units
+    width_mm = width_px / dpi * 25.4
+    height_mm = height_px / dpi * 25.4
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width_mm:.3f}mm" height="{height_mm:.3f}mm" '
+        f'viewBox="0 0 {width_px} {height_px}" shape-rendering="crispEdges">'
+        f'<rect width="{width_px}" height="{height_px}" fill="#fff"/>'
+        f'<g transform="matrix({scale} 0 0 {scale} {margin_px} {margin_px})">{body}</g>'
+        '</svg>\n'
+    )
+
+
+def glyph_width(rects):
+    # The usual advance after a glyph: its ink plus a one-cell gap, as
+    # render_text.get_char_width measures it
+    return max(i + w for i, j, w, h in rects) + 1
+
+
+def pdf_text(placed, codes, widths):
+    # Shows a page's glyphs as text in lattice units: a Td to the start of
+    # every line, then one TJ array for the line. Glyph widths cover the
+    # advance inside words, so only the gaps between words need an offset.
+    # codes maps a glyph index to n, which is code n % 256 of font /F(n // 256).
+    ops = ["BT"]
+    font = None
+    prev_i = prev_j = 0
+    k = 0
+    while k < len(placed):
+        i, j, index = placed[k]
+        if codes[index] >> 8 != font:
+            font = codes[index] >> 8
+            ops.append(f"/F{font} 1 Tf")
+        ops.append(f"{i - prev_i} {j - prev_j} Td")
+        prev_i, prev_j = i, j
+        shown = []
+        text = bytearray()
+        x = i
+        while k < len(placed) and placed[k][1] == j and codes[placed[k][2]] >> 8 == font:
+            i, _, index = placed[k]
+            if i != x:
+                shown.append(f"<{text.hex()}>{(x - i) * 1000}")
+                text = bytearray()
+            text.append(codes[index] & 255)
+            x = i + widths[index]
+            k += 1
+        shown.append(f"<{text.hex()}>")
+        ops.append("[" + "".join(shown) + "]TJ")
+    ops.append("ET")
+    return ops
+
+
+def pdf_document(pages_placed, glyphs, width_px, height_px, margin_px, scale, dpi):
+    # A minimal PDF. Every glyph used at least PDF_MIN_USES times is drawn
+    # once, as "re" operators in lattice units, in a Type 3 font of up to 256
+    # glyphs, and the Flate-compressed content stream of each page shows these
+    # glyphs as text. The remaining rectangles are filled directly.
+    pt = 72 / dpi
+    width_pt = width_px * pt
+    height_pt = height_px * pt
+    pages_split = split_shared(pages_placed, glyphs, PDF_MIN_USES)
+    font_glyphs = sorted({index for shared, _ in pages_split for _, _, index in shared})
+    codes = {index: n for n, index in enumerate(font_glyphs)}
+    widths = {index: glyph_width(glyphs[index]) for index in font_glyphs}
+    objects = [None, None, None] # catalog, page tree and the resources shared by all pages
+    page_ids = []
+
+    def add_stream(text):
+        stream = zlib.compress(text.encode("ascii"), 9)
+        objects.append(b"<< /Length %d /Filter /FlateDecode >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        return len(objects)
+
+    for shared, rects in pages_split:
+        ops = [f"{scale * pt:.6f} 0 0 {-scale * pt:.6f} {margin_px * pt:.6f} {height_pt - margin_px * pt:.6f} cm"]
+        if shared:
+            ops.extend(pdf_text(shared, codes, widths))
+        ops.extend(f"{i} {j} {w} {h} re" for i, j, w, h in rects)
+        if rects:
+            ops.append("f")
+        content_id = add_stream("\n".join(ops))
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {width_pt:.4f} {height_pt:.4f}] "
+            f"/Resources 3 0 R /Contents {content_id} 0 R >>".encode("ascii")
+        )
+        page_ids.append(len(objects))
+
+    font_ids = []
+    for start in range(0, len(font_glyphs), 256):
+        font = font_glyphs[start:start + 256]
+        objects.append(None)
+        font_ids.append(len(objects))
+        proc_ids = []
+        for index in font:
+            ops = [f"{widths[index]} 0 d0"]
+            ops.extend(f"{i} {j} {w} {h} re" for i, j, w, h in glyphs[index])
+            ops.append("f")
+            proc_ids.append(add_stream("\n".join(ops)))
+        procs = " ".join(f"/g{code} {proc_id} 0 R" for code, proc_id in enumerate(proc_ids))
+        names = " ".join(f"/g{code}" for code in range(len(font)))
+        bbox_w = max(i + w for index in font for i, j, w, h in glyphs[index])
+        bbox_h = max(j + h for index in font for i, j, w, h in glyphs[index])
+        font_widths = " ".join(str(widths[index]) for index in font)
+        objects[font_ids[-1] - 1] = (
+            f"<< /Type /Font /Subtype /Type3 /FontBBox [0 0 {bbox_w} {bbox_h}] /FontMatrix [1 0 0 1 0 0] "
+            f"/CharProcs << {procs} >> /Encoding << /Type /Encoding /Differences [0 {names}] >> "
+            f"/FirstChar 0 /LastChar {len(font) - 1} /Widths [{font_widths}] /Resources << >> >>"
+        ).encode("ascii")
+
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids)
+    fonts = " ".join(f"/F{font} {font_id} 0 R" for font, font_id in enumerate(font_ids))
+    objects[0] = b"<< /Type /Catalog /Pages 2 0 R >>"
+    objects[1] = f"<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>".encode("ascii")
+    objects[2] = f"<< /Font << {fonts} >> >>".encode("ascii")
+
+    out = [b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n"]
+    offsets = []
+    size = len(out[0])
+    for number, body in enumerate(objects, start=1):
+        chunk = b"%d 0 obj\n" % number + body + b"\nendobj\n"
+        offsets.append(size)
+        out.append(chunk)
+        size += len(chunk)
+    xref = [b"xref\n0 %d\n" % (len(objects) + 1), b"0000000000 65535 f \n"]
+    xref.extend(b"%010d 00000 n \n" % offset for offset in offsets)
+    out.extend(xref)
+    out.append(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, size))
+    return b"".join(out)
+
+
+def save_vector(fmt, pages, out, width_px, height_px, margin_px, max_rows, max_cols, scale, dpi, first_page=1, page_count=None):
+    base = os.path.splitext(out)[0]
+    ext = "." + fmt
+    width_mm = width_px / dpi * 25.4
+    height_mm = height_px / dpi * 25.4
+    glyphs = []
+    glyph_ids = {}
+    pages_placed = [page_glyphs(page, glyphs, glyph_ids, margin_px, max_rows, max_cols, scale) for page in pages]
+
+    if fmt == "pdf":
+        out_name = base + ext
+        with open(out_name, "wb") as f:
+            f.write(pdf_document(pages_placed, glyphs, width_px, height_px, margin_px, scale, dpi))
+        glyph_count = sum(len(placed) for placed in pages_placed)
+        print(f"Saved to {out_name} ({len(pages_placed)} pages, {glyph_count} glyphs of {len(glyphs)} shapes, "
+              f"{width_mm:.1f}x{height_mm:.1f} mm)")
+        return
+
+    if page_count is None:
+        page_count = len(pages_placed)
+    for i, placed in enumerate(pages_placed):
+        out_name = base + ext if page_count == 1 else f"{base}_{i+first_page}{ext}"
+        if fmt == "svgz":
+            svg = svg_page(svg_glyph_path(placed, glyphs), width_px, height_px, margin_px, scale, dpi)
+            data = gzip.compress(svg.encode("ascii"), 9, mtime=0)
+        else:
+            data = svg_page(svg_uses(placed, glyphs), width_px, height_px, margin_px, scale, dpi).encode("ascii")
+        with open(out_name, "wb") as f:
+            f.write(data)
+        print(f"Saved to {out_name} ({len(placed)} glyphs, {width_mm:.1f}x{height_mm:.1f} mm)")